@@ -4,10 +4,11 @@ from app.database import get_db
 from app.models import AnalysisRun, Finding, Project, User, RunStatus
 from app.config import settings
 from app.services.auth_service import get_current_user
-from app.tasks.analysis import analyze_pr_task
+from app.tasks.analysis import analyze_pr_task, deduplicate_findings
 from typing import Optional, List
 from datetime import datetime
 from pydantic import BaseModel
+import asyncio
 import logging
 import json
 
@@ -234,7 +235,7 @@ async def generate_fix_on_demand(finding_id: int, db: Session = Depends(get_db),
         return {"finding_id": finding_id, "auto_fix_code": finding.auto_fix_code, "cached": True}
     
     try:
-        from app.services.llm_service import LLMService
+        from app.services.llm_service import get_llm_service
         # Use per-user API keys if configured
         user_keys = {
             "groq_api_key": current_user.groq_api_key,
@@ -243,7 +244,7 @@ async def generate_fix_on_demand(finding_id: int, db: Session = Depends(get_db),
             "google_api_key": current_user.google_api_key,
             "preferred_llm_provider": current_user.preferred_llm_provider,
         }
-        llm = LLMService(user_keys=user_keys)
+        llm = get_llm_service(user_keys)
         
         finding_data = {
             "title": finding.title,
@@ -254,7 +255,8 @@ async def generate_fix_on_demand(finding_id: int, db: Session = Depends(get_db),
             "suggestion": finding.suggestion,
         }
         
-        fix = llm.generate_auto_fix(finding_data, finding.code_snippet or "")
+        # The provider call blocks; keep it off the event loop
+        fix = await asyncio.to_thread(llm.generate_auto_fix, finding_data, finding.code_snippet or "")
         if fix:
             finding.auto_fix_code = fix
             db.commit()
@@ -339,7 +341,7 @@ async def analyze_pr_manual(
 
     try:
         gh = GitHubPATService(current_user.github_token)
-        pr_info = gh.get_pr_info(project.github_repo_full_name, body.pr_number)
+        pr_info = await asyncio.to_thread(gh.get_pr_info, project.github_repo_full_name, body.pr_number)
     except Exception as e:
         logger.error(f"Failed to fetch PR info: {e}")
         raise HTTPException(status_code=400, detail=f"Failed to fetch PR #{body.pr_number}: {str(e)}")
@@ -387,9 +389,11 @@ async def analyze_pr_manual(
         except Exception as e:
             logger.warning(f"Celery unavailable, running inline: {e}")
 
-    # Synchronous inline analysis (no Celery)
+    # Synchronous inline analysis (no Celery). It makes blocking GitHub and
+    # LLM calls for tens of seconds, so it runs on a worker thread while this
+    # request awaits it and the event loop keeps serving others.
     try:
-        _run_analysis_inline(analysis_run.id, current_user, db)
+        await asyncio.to_thread(_run_analysis_inline, analysis_run.id, current_user, db)
         db.refresh(analysis_run)
         return {
             "message": "Analysis completed",
@@ -410,7 +414,7 @@ def _run_analysis_inline(run_id: int, user: User, db: Session):
     """Run PR analysis synchronously (no Celery) using user's PAT and API keys."""
     from app.services.github_pat_service import GitHubPATService
     from app.services.analyzer_service import AnalyzerService
-    from app.services.llm_service import LLMService
+    from app.services.llm_service import get_llm_service
     from app.models import FindingSeverity, FindingCategory
     from collections import defaultdict
 
@@ -444,7 +448,7 @@ def _run_analysis_inline(run_id: int, user: User, db: Session):
         "google_api_key": user.google_api_key,
         "preferred_llm_provider": user.preferred_llm_provider,
     }
-    llm_service = LLMService(user_keys=user_keys)
+    llm_service = get_llm_service(user_keys)
 
     # Run rule-based analysis
     logger.info("Running rule-based analysis...")
@@ -452,32 +456,13 @@ def _run_analysis_inline(run_id: int, user: User, db: Session):
 
     # Run AI analysis
     logger.info("Running AI analysis...")
-    ai_findings = llm_service.analyze_diff(diff_data, rule_findings)
+    ai_findings = llm_service.analyze_diff(
+        diff_data, rule_findings, repo_full_name=project.github_repo_full_name
+    )
 
-    # Merge and deduplicate
+    # Merge and deduplicate (same rules as the Celery task)
     all_findings = rule_findings + ai_findings
-
-    # Deduplicate
-    grouped = defaultdict(list)
-    for finding in all_findings:
-        key = (finding["file_path"], finding.get("line_number", 0))
-        grouped[key].append(finding)
-
-    deduplicated_findings = []
-    severity_order = {
-        FindingSeverity.CRITICAL: 0, FindingSeverity.HIGH: 1,
-        FindingSeverity.MEDIUM: 2, FindingSeverity.LOW: 3,
-    }
-    for (file_path, line_number), group in grouped.items():
-        if len(group) == 1:
-            deduplicated_findings.append(group[0])
-        else:
-            group_sorted = sorted(group, key=lambda f: severity_order.get(f["severity"], 4))
-            merged = group_sorted[0].copy()
-            categories = set(f["category"] for f in group)
-            if len(categories) > 1:
-                merged["description"] += f"\n\nAdditional concerns: {', '.join(c.value for c in categories if c != merged['category'])}"
-            deduplicated_findings.append(merged)
+    deduplicated_findings = deduplicate_findings(all_findings)
 
     # Save findings
     from app.services.semantic_search import get_semantic_search_service
@@ -485,15 +470,14 @@ def _run_analysis_inline(run_id: int, user: User, db: Session):
     
     semantic_search = get_semantic_search_service()
     code_sandbox = get_code_sandbox()
+    # Index the diff once rather than scanning it for every finding
+    files_by_name = {f["filename"]: f for f in diff_data}
     
     for finding_data in deduplicated_findings:
         auto_fix = ""
         if finding_data["severity"] in (FindingSeverity.CRITICAL, FindingSeverity.HIGH):
             try:
-                file_patch = next(
-                    (f.get("patch", "") for f in diff_data if f["filename"] == finding_data["file_path"]),
-                    "",
-                )
+                file_patch = files_by_name.get(finding_data["file_path"], {}).get("patch", "")
                 if file_patch:
                     auto_fix = llm_service.generate_auto_fix(finding_data, file_patch)
             except Exception as e:
@@ -572,9 +556,12 @@ def _run_analysis_inline(run_id: int, user: User, db: Session):
 
     # Post results to PR (best-effort)
     try:
-        critical = [f for f in deduplicated_findings if f["severity"] == FindingSeverity.CRITICAL]
-        high = [f for f in deduplicated_findings if f["severity"] == FindingSeverity.HIGH]
-        medium = [f for f in deduplicated_findings if f["severity"] == FindingSeverity.MEDIUM]
+        by_severity = defaultdict(list)
+        for f in deduplicated_findings:
+            by_severity[f["severity"]].append(f)
+        critical = by_severity[FindingSeverity.CRITICAL]
+        high = by_severity[FindingSeverity.HIGH]
+        medium = by_severity[FindingSeverity.MEDIUM]
 
         summary = f"""## 🤖 AI Code Review Summary
 
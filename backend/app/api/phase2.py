@@ -8,6 +8,7 @@ from app.services.code_sandbox import get_code_sandbox
 from app.api.auth import get_current_user
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
+import asyncio
 import logging
 
 router = APIRouter()
@@ -74,7 +75,10 @@ async def search_similar_findings(
     
     # Search for similar findings
     try:
-        similar_findings = semantic_search.search_similar_findings(
+        # Embedding the query and scoring history is CPU-bound; keep it off
+        # the event loop
+        similar_findings = await asyncio.to_thread(
+            semantic_search.search_similar_findings,
             db,
             query_description=request.query,
             project_id=request.project_id,
@@ -122,7 +126,8 @@ async def analyze_patterns(
     
     # Analyze patterns
     try:
-        patterns = semantic_search.analyze_finding_patterns(
+        patterns = await asyncio.to_thread(
+            semantic_search.analyze_finding_patterns,
             db,
             project_id=request.project_id,
             min_similarity=request.min_similarity
@@ -160,12 +165,15 @@ async def test_code_sandbox(
     
     try:
         if request.language == "python":
-            result = sandbox.test_python_code(
+            # Container runs block for seconds; keep them off the event loop
+            result = await asyncio.to_thread(
+                sandbox.test_python_code,
                 request.code,
                 request.test_code
             )
         elif request.language in ["javascript", "typescript"]:
-            result = sandbox.test_javascript_code(
+            result = await asyncio.to_thread(
+                sandbox.test_javascript_code,
                 request.code,
                 request.test_code
             )
@@ -205,7 +213,8 @@ async def test_auto_fix(
         )
     
     try:
-        result = sandbox.test_auto_fix(
+        result = await asyncio.to_thread(
+            sandbox.test_auto_fix,
             original_code=request.original_code,
             fixed_code=request.fixed_code,
             language=request.language,
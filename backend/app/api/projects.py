@@ -7,6 +7,7 @@ from app.services.auth_service import get_current_user
 from app.services.github_pat_service import GitHubPATService
 from pydantic import BaseModel
 from typing import Optional, Dict
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
@@ -112,7 +113,7 @@ async def add_repo(
     # Validate repo access with user's PAT
     try:
         gh = GitHubPATService(current_user.github_token)
-        repo_info = gh.validate_repo_access(repo_full_name)
+        repo_info = await asyncio.to_thread(gh.validate_repo_access, repo_full_name)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"GitHub API error: {str(e)}")
 
@@ -159,7 +160,7 @@ async def list_project_prs(
 
     try:
         gh = GitHubPATService(current_user.github_token)
-        prs = gh.list_open_prs(project.github_repo_full_name)
+        prs = await asyncio.to_thread(gh.list_open_prs, project.github_repo_full_name)
         return {"prs": prs, "count": len(prs)}
     except Exception as e:
         logger.error(f"Failed to list PRs for {project.github_repo_full_name}: {e}")
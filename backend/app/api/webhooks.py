@@ -7,11 +7,17 @@ from app.tasks.analysis import analyze_pr_task
 from app.config import settings
 import logging
 import hmac
-import hashlib
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
 # In-memory set of processed delivery IDs for idempotency
 # In production, use Redis or a DB table for this
 _processed_deliveries: set[str] = set()
@@ -20,15 +26,14 @@ _MAX_DELIVERY_CACHE = 10000
 
 def verify_webhook_signature(payload_body: bytes, signature_header: str, secret: str) -> bool:
     """Verify webhook HMAC signature."""
-    if not signature_header or not secret:
+    if not signature_header or not secret or not signature_header.startswith("sha256="):
+        return False
+    try:
+        received = bytes.fromhex(signature_header[7:])
+    except ValueError:
         return False
-    hash_object = hmac.new(
-        secret.encode("utf-8"),
-        msg=payload_body,
-        digestmod=hashlib.sha256,
-    )
-    expected_signature = "sha256=" + hash_object.hexdigest()
-    return hmac.compare_digest(expected_signature, signature_header)
+    expected = hmac.digest(secret.encode("utf-8"), payload_body, "sha256")
+    return hmac.compare_digest(expected, received)
 
 
 @router.post("/github")
@@ -64,7 +69,7 @@ async def github_webhook(
             raise HTTPException(status_code=401, detail="Invalid signature")
         
         # Parse event
-        payload = await request.json()
+        payload = _json_loads(body)
         
         # Only handle pull request events
         if x_github_event not in ["pull_request", "pull_request_review"]:
@@ -170,7 +175,7 @@ async def github_webhook_user(
             raise HTTPException(status_code=401, detail="Invalid webhook signature")
 
         # Parse payload
-        payload = await request.json()
+        payload = _json_loads(body)
 
         # Only handle PR events
         if x_github_event not in ["pull_request", "pull_request_review"]:
@@ -86,6 +86,10 @@ class Settings(BaseSettings):
     groq_api_key: Optional[str] = Field(default_factory=lambda: _get_env("GROQ_API_KEY") or None)
     groq_model: str = Field(default_factory=lambda: _get_env("GROQ_MODEL", "llama-3.3-70b-versatile"))
     llm_provider: str = Field(default_factory=lambda: _get_env("LLM_PROVIDER", "groq"))
+    # Self-hosted OpenAI-compatible server (vLLM, llama.cpp server), e.g. http://localhost:8000/v1
+    local_llm_base_url: Optional[str] = Field(default_factory=lambda: _get_env("LOCAL_LLM_BASE_URL") or None)
+    local_llm_model: str = Field(default_factory=lambda: _get_env("LOCAL_LLM_MODEL", "qwen2.5-coder-7b-instruct"))
+    local_llm_api_key: Optional[str] = Field(default_factory=lambda: _get_env("LOCAL_LLM_API_KEY") or None)
     
     # Redis
     redis_url: str = Field(default_factory=lambda: _get_env("REDIS_URL", "redis://localhost:6379/0"))
@@ -132,6 +136,34 @@ class Settings(BaseSettings):
     # Analysis Config
     max_files_per_analysis: int = Field(default_factory=lambda: _safe_int(_get_env("MAX_FILES_PER_ANALYSIS"), 50))
     max_lines_per_llm_call: int = Field(default_factory=lambda: _safe_int(_get_env("MAX_LINES_PER_LLM_CALL"), 500))
+    max_prompt_tokens: int = Field(default_factory=lambda: _safe_int(_get_env("MAX_PROMPT_TOKENS"), 12000))
+    # Small changed files are reviewed up to this many per request (1 disables)
+    llm_max_files_per_call: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_MAX_FILES_PER_CALL"), 5))
+    # Files with at least this many rule-based findings skip the LLM pass (0 disables)
+    llm_skip_rule_findings_threshold: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_SKIP_RULE_FINDINGS_THRESHOLD"), 8))
+    # Review with a cheap model first; re-run with the full model on high/critical hits
+    llm_triage: bool = Field(default_factory=lambda: str_to_bool(_get_env("LLM_TRIAGE")))
+    # Reuse cached findings when the same patch reappears at other line numbers in the same repo (rebase, cherry-pick)
+    llm_reuse_moved_findings: bool = Field(default_factory=lambda: str_to_bool(_get_env("LLM_REUSE_MOVED_FINDINGS"), True))
+    # Worker threads shared by all in-flight analyses for blocking LLM calls
+    llm_concurrency: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_CONCURRENCY"), 8))
+    # Per-request timeout for provider SDK calls (their default is 10 minutes)
+    llm_request_timeout_seconds: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_REQUEST_TIMEOUT_SECONDS"), 60))
+    # Client-side pacing per provider API key, below its RPM quota (0 disables)
+    llm_requests_per_minute: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_REQUESTS_PER_MINUTE"), 0))
+    # Per-provider overrides of LLM_REQUESTS_PER_MINUTE (0 uses the shared value)
+    groq_requests_per_minute: int = Field(default_factory=lambda: _safe_int(_get_env("GROQ_REQUESTS_PER_MINUTE"), 0))
+    openai_requests_per_minute: int = Field(default_factory=lambda: _safe_int(_get_env("OPENAI_REQUESTS_PER_MINUTE"), 0))
+    anthropic_requests_per_minute: int = Field(default_factory=lambda: _safe_int(_get_env("ANTHROPIC_REQUESTS_PER_MINUTE"), 0))
+    google_requests_per_minute: int = Field(default_factory=lambda: _safe_int(_get_env("GOOGLE_REQUESTS_PER_MINUTE"), 0))
+    # Route background (Celery) multi-file reviews through provider Batch APIs (cheaper, but slower)
+    use_llm_batch_api: bool = Field(default_factory=lambda: str_to_bool(_get_env("USE_LLM_BATCH_API")))
+    llm_batch_timeout_seconds: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_BATCH_TIMEOUT_SECONDS"), 600))
+    # Identical prompts reuse the stored response for this long (0 disables)
+    llm_cache_ttl_seconds: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_CACHE_TTL_SECONDS"), 86400))
+    llm_cache_path: str = Field(default_factory=lambda: _get_env("LLM_CACHE_PATH") or str(Path(gettempdir()) / "llm_cache.db"))
+    # Oldest entries beyond this many are evicted so the cache file stays bounded
+    llm_cache_max_entries: int = Field(default_factory=lambda: _safe_int(_get_env("LLM_CACHE_MAX_ENTRIES"), 5000))
 
     _resolved_private_key_path: Optional[Path] = None
 
@@ -6,6 +6,7 @@ and support for correlation IDs for request tracing.
 """
 
 import logging
+import re
 import sys
 from typing import Any
 from app.config import settings
@@ -18,6 +19,9 @@ class SanitizingFormatter(logging.Formatter):
         'password', 'token', 'secret', 'api_key', 'private_key',
         'authorization', 'jwt', 'credentials', 'apikey'
     ]
+    # Every log record is checked, so scan once with a compiled alternation
+    # instead of lowercasing and searching once per key
+    _SENSITIVE_RE = re.compile('|'.join(map(re.escape, SENSITIVE_KEYS)), re.IGNORECASE)
     
     def format(self, record: logging.LogRecord) -> str:
         # Sanitize message
@@ -32,7 +36,7 @@ class SanitizingFormatter(logging.Formatter):
         """Remove sensitive keys from dictionary."""
         sanitized = {}
         for key, value in data.items():
-            if any(sensitive in key.lower() for sensitive in self.SENSITIVE_KEYS):
+            if self._SENSITIVE_RE.search(key):
                 sanitized[key] = '***REDACTED***'
             elif isinstance(value, dict):
                 sanitized[key] = self._sanitize_dict(value)
@@ -43,9 +47,9 @@ class SanitizingFormatter(logging.Formatter):
     def _sanitize_string(self, text: str) -> str:
         """Basic string sanitization."""
         # Don't log potential tokens/keys
-        for sensitive in self.SENSITIVE_KEYS:
-            if sensitive in text.lower():
-                return f"Log message redacted (contains: {sensitive})"
+        match = self._SENSITIVE_RE.search(text)
+        if match:
+            return f"Log message redacted (contains: {match.group(0).lower()})"
         return text
 
 
@@ -1,5 +1,6 @@
 """AST Analyzer Service using tree-sitter for code structure analysis"""
 import logging
+import threading
 from typing import Dict, List, Optional, Any
 from pathlib import Path
 
@@ -22,17 +23,31 @@ class ASTAnalyzer:
 
             self._Language = Language
             self._Parser = Parser
-            # Initialize parsers for different languages
-            self.parsers = {
-                "python": self._create_parser(Language(tree_sitter_python.language())),
-                "javascript": self._create_parser(Language(tree_sitter_javascript.language())),
-                "typescript": self._create_parser(Language(tree_sitter_typescript.language_typescript())),
+            self._languages = {
+                "python": Language(tree_sitter_python.language()),
+                "javascript": Language(tree_sitter_javascript.language()),
+                "typescript": Language(tree_sitter_typescript.language_typescript()),
             }
             self._available = True
         except Exception as exc:
             logger.warning("tree-sitter not available (%s). AST analysis will be disabled.", exc)
-            self.parsers = {}
+            self._languages = {}
             self._available = False
+        # The analyzer is a process-wide singleton and concurrent analyses
+        # (API requests under asyncio.to_thread, Celery threads) parse on
+        # different threads. A tree-sitter Parser must not be used by two
+        # threads at once, so each thread builds its own on first use;
+        # Language objects are shared
+        self._local = threading.local()
+    
+    @property
+    def parsers(self) -> Dict[str, Any]:
+        """This thread's parsers, one per supported language"""
+        parsers = getattr(self._local, "parsers", None)
+        if parsers is None:
+            parsers = {name: self._create_parser(language) for name, language in self._languages.items()}
+            self._local.parsers = parsers
+        return parsers
     
     def _create_parser(self, language) -> 'object':
         """Create a parser for a specific language"""
@@ -106,6 +121,7 @@ class ASTAnalyzer:
                 "name": func_name,
                 "params": params,
                 "line": line_number,
+                "end_line": node.end_point[0] + 1,
                 "type": "function"
             })
         
@@ -162,6 +178,7 @@ class ASTAnalyzer:
             functions.append({
                 "name": func_name,
                 "line": line_number,
+                "end_line": node.end_point[0] + 1,
                 "type": "function"
             })
         
@@ -179,6 +196,7 @@ class ASTAnalyzer:
             functions.append({
                 "name": name,
                 "line": line_number,
+                "end_line": node.end_point[0] + 1,
                 "type": "function"
             })
         
@@ -1,12 +1,93 @@
 """
 Diff parser for extracting changed hunks and lines from GitHub PR diffs
 """
+import io
 import re
 import logging
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple, NamedTuple
 
 logger = logging.getLogger(__name__)
 
+# google-re2 is an optional DFA-based engine. It only pays off for large batch
+# ingestion (hundreds of PRs per minute); the stdlib engine is used otherwise.
+try:
+    import re2 as _re
+except ImportError:
+    _re = re
+
+# Hunk header: @@ -old_start,old_count +new_start,new_count @@
+_HUNK_HEADER_RE = _re.compile(r'^@@\s+-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s+@@')
+_HUNK_HEADER_RE_B = _re.compile(rb'^@@\s+-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s+@@')
+
+# Function definition patterns used by extract_function_context
+_FUNCTION_PATTERNS = [
+    re.compile(r'^\s*(?:async\s+)?def\s+(\w+)\s*\(', re.MULTILINE),  # Python
+    re.compile(r'^\s*(?:async\s+)?function\s+(\w+)\s*\(', re.MULTILINE),  # JavaScript
+    re.compile(r'^\s*(?:public|private|protected)?\s*\w+\s+(\w+)\s*\(', re.MULTILINE),  # Java/C++
+]
+
+
+class ChangedLine(NamedTuple):
+    """An added or removed line inside a hunk (tuple-sized, no per-row dict)"""
+    line_number: int
+    code: str
+
+
+_PLUS, _MINUS, _SPACE, _AT = b'+- @'
+
+
+def _parse_patch_fast(buf: bytes) -> Tuple[list, list, list]:
+    """Scan a raw patch without building per-line objects.
+    
+    Line boundaries are located with bytes.find (C-level) and only the first
+    byte of each line is inspected, so no code strings are allocated.
+    
+    Returns (hunks, added, removed) where hunks are
+    (old_start, old_count, new_start, new_count) tuples and added/removed are
+    (line_number, start, end) tuples; ``buf[start:end]`` is the line's code.
+    """
+    hunks = []
+    added = []
+    removed = []
+    in_hunk = False
+    old_line_no = 0
+    new_line_no = 0
+    pos = 0
+    size = len(buf)
+    
+    while pos < size:
+        end = buf.find(b'\n', pos)
+        if end == -1:
+            end = size
+        first = buf[pos] if end > pos else None
+        
+        if first == _AT:
+            hunk_match = _HUNK_HEADER_RE_B.match(buf[pos:end])
+            if hunk_match:
+                old_line_no = int(hunk_match.group(1))
+                new_line_no = int(hunk_match.group(3))
+                hunks.append((
+                    old_line_no,
+                    int(hunk_match.group(2) or 1),
+                    new_line_no,
+                    int(hunk_match.group(4) or 1),
+                ))
+                in_hunk = True
+        elif in_hunk:
+            if first == _PLUS:
+                added.append((new_line_no, pos + 1, end))
+                new_line_no += 1
+            elif first == _MINUS:
+                removed.append((old_line_no, pos + 1, end))
+                old_line_no += 1
+            elif first == _SPACE:
+                old_line_no += 1
+                new_line_no += 1
+        
+        pos = end + 1
+    
+    return hunks, added, removed
+
 
 class DiffParser:
     """Parse unified diff format from GitHub PRs"""
@@ -17,11 +98,17 @@ class DiffParser:
         Parse a unified diff patch and extract changed lines
         
         Returns dict with:
-        - hunks: List of changed hunks with line ranges
+        - hunks: List of changed hunks with line ranges; each hunk's
+          "added"/"removed" entries are ChangedLine(line_number, code) tuples
         - added_lines: Dict mapping line numbers to added code
         - removed_lines: Dict mapping line numbers to removed code
         - context: Full context for each hunk
+        
+        Raw ``bytes`` patches are handed to parse_patch_bytes.
         """
+        if isinstance(patch, bytes):
+            return DiffParser.parse_patch_bytes(patch, filename)
+        
         if not patch:
             return {
                 "hunks": [],
@@ -41,7 +128,7 @@ class DiffParser:
         
         for line in lines:
             # Parse hunk header: @@ -old_start,old_count +new_start,new_count @@
-            hunk_match = re.match(r'^@@\s+-(\d+)(?:,(\d+))?\s+\+(\d+)(?:,(\d+))?\s+@@', line)
+            hunk_match = _HUNK_HEADER_RE.match(line) if line.startswith('@@') else None
             if hunk_match:
                 if current_hunk:
                     hunks.append(current_hunk)
@@ -72,10 +159,7 @@ class DiffParser:
             if line.startswith('+'):
                 code = line[1:]
                 added_lines[new_line_no] = code
-                current_hunk["added"].append({
-                    "line_number": new_line_no,
-                    "code": code
-                })
+                current_hunk["added"].append(ChangedLine(new_line_no, code))
                 current_hunk["context"].append(line)
                 new_line_no += 1
             
@@ -83,10 +167,7 @@ class DiffParser:
             elif line.startswith('-'):
                 code = line[1:]
                 removed_lines[old_line_no] = code
-                current_hunk["removed"].append({
-                    "line_number": old_line_no,
-                    "code": code
-                })
+                current_hunk["removed"].append(ChangedLine(old_line_no, code))
                 current_hunk["context"].append(line)
                 old_line_no += 1
             
@@ -107,11 +188,152 @@ class DiffParser:
             "filename": filename
         }
     
+    @staticmethod
+    def parse_patch_bytes(patch: bytes, filename: str) -> Dict:
+        """Parse a unified diff patch given as raw UTF-8 bytes"""
+        return DiffParser.parse_patch(patch.decode('utf-8', 'replace'), filename)
+    
     @staticmethod
     def get_changed_line_numbers(patch: str) -> List[int]:
         """Extract just the added line numbers from a patch"""
-        result = DiffParser.parse_patch(patch, "")
-        return sorted(result["added_lines"].keys())
+        if not patch:
+            return []
+        if isinstance(patch, str):
+            patch = patch.encode('utf-8')
+        _, added, _ = _parse_patch_fast(patch)
+        return sorted({line_number for line_number, _, _ in added})
+    
+    @staticmethod
+    def get_hunk_ranges(patch: str) -> List[Tuple[int, int]]:
+        """(new_start, new_count) of each hunk, in patch order"""
+        if not patch:
+            return []
+        if isinstance(patch, str):
+            patch = patch.encode('utf-8')
+        hunks, _, _ = _parse_patch_fast(patch)
+        return [(new_start, new_count) for _, _, new_start, new_count in hunks]
+    
+    @staticmethod
+    def reconstruct_new_file(patch: str) -> Optional[str]:
+        """Rebuild a newly added file's content from its patch.
+        
+        Returns None unless the patch is a single "@@ -0,0 +1,N @@" hunk
+        made only of N added lines, i.e. it holds the whole file.
+        """
+        if not patch:
+            return None
+        lines = patch.split('\n')
+        match = _HUNK_HEADER_RE.match(lines[0])
+        if not match or match.group(1) != '0' or match.group(3) != '1':
+            return None
+        expected = int(match.group(4)) if match.group(4) is not None else 1
+        
+        body = lines[1:]
+        trailing_newline = True
+        if body and body[-1] == '':
+            body.pop()
+        if body and body[-1].startswith('\\'):
+            # "\ No newline at end of file"
+            body.pop()
+            trailing_newline = False
+        if len(body) != expected or not all(line.startswith('+') for line in body):
+            return None
+        
+        content = '\n'.join(line[1:] for line in body)
+        if body and trailing_newline:
+            content += '\n'
+        return content
+    
+    @staticmethod
+    def compress_patch(patch: str, context: int = 3) -> str:
+        """Drop context lines more than `context` lines away from any change.
+        
+        A hunk is split wherever lines are dropped, and each piece gets a
+        header with exact counts, so line numbers in the result stay right.
+        The patch is returned unchanged when nothing would be dropped.
+        """
+        if not patch:
+            return patch
+        trailing = '\n' if patch.endswith('\n') else ''
+        lines = patch[:len(patch) - len(trailing)].split('\n')
+        out = []
+        dropped = False
+        i = 0
+        
+        while i < len(lines):
+            match = _HUNK_HEADER_RE.match(lines[i])
+            if not match:
+                out.append(lines[i])
+                i += 1
+                continue
+            header_suffix = lines[i][match.end():]
+            old_no = int(match.group(1))
+            new_no = int(match.group(3))
+            j = i + 1
+            while j < len(lines) and not lines[j].startswith('@@'):
+                j += 1
+            body = lines[i + 1:j]
+            i = j
+            
+            keep = [False] * len(body)
+            for k, line in enumerate(body):
+                if line[:1] in ('+', '-'):
+                    for m in range(max(0, k - context), min(len(body), k + context + 1)):
+                        keep[m] = True
+                elif line[:1] == '\\' and k:
+                    # "\ No newline at end of file" follows its line
+                    keep[k] = keep[k - 1]
+            if not all(keep):
+                dropped = True
+            
+            k = 0
+            first = True
+            while k < len(body):
+                if not keep[k]:
+                    if body[k][:1] != '\\':
+                        old_no += 1
+                        new_no += 1
+                    k += 1
+                    continue
+                seg_old, seg_new = old_no, new_no
+                start = k
+                while k < len(body) and keep[k]:
+                    kind = body[k][:1]
+                    if kind != '+' and kind != '\\':
+                        old_no += 1
+                    if kind != '-' and kind != '\\':
+                        new_no += 1
+                    k += 1
+                out.append(
+                    f"@@ -{seg_old},{old_no - seg_old} +{seg_new},{new_no - seg_new} @@"
+                    + (header_suffix if first else '')
+                )
+                out.extend(body[start:k])
+                first = False
+        
+        if not dropped:
+            return patch
+        return '\n'.join(out) + trailing
+    
+    @staticmethod
+    def strip_hunk_positions(patch: str) -> Tuple[str, List[int]]:
+        """Split a patch into its position-free text and its hunk starts.
+        
+        Hunk headers lose their line numbers, so the same change applied at
+        a different place in the file (a rebase, a cherry-pick) gives the
+        same text. The new-file start line of each hunk is returned in
+        order, for mapping line numbers between the two placements.
+        """
+        if not patch:
+            return patch or '', []
+        lines = patch.split('\n')
+        starts = []
+        for i, line in enumerate(lines):
+            match = _HUNK_HEADER_RE.match(line) if line.startswith('@@') else None
+            if match:
+                starts.append(int(match.group(3)))
+                lines[i] = '@@ @@' + line[match.end():]
+        return '\n'.join(lines), starts
     
     @staticmethod
     def get_hunk_for_line(parsed_diff: Dict, line_number: int) -> Dict:
@@ -138,21 +360,18 @@ class DiffParser:
         if not hunk:
             return ""
         
-        lines = []
-        lines.append(f"@@ -{hunk['old_start']},{hunk['old_count']} +{hunk['new_start']},{hunk['new_count']} @@")
-        
-        for context_line in hunk.get("context", []):
-            if highlight_line:
-                # Try to detect if this is the highlighted line
-                if context_line.startswith('+'):
-                    # Rough estimate - need to track line numbers properly
-                    lines.append(f">>> {context_line}")
-                else:
-                    lines.append(context_line)
-            else:
-                lines.append(context_line)
-        
-        return '\n'.join(lines)
+        buf = io.StringIO()
+        buf.write(f"@@ -{hunk['old_start']},{hunk['old_count']} +{hunk['new_start']},{hunk['new_count']} @@")
+        
+        for context_line in hunk.get("context", ()):
+            buf.write('\n')
+            # Try to detect if this is the highlighted line
+            # (rough estimate - need to track line numbers properly)
+            if highlight_line and context_line.startswith('+'):
+                buf.write('>>> ')
+            buf.write(context_line)
+        
+        return buf.getvalue()
     
     @staticmethod
     def extract_function_context(patch: str, line_number: int) -> Tuple[str, int, int]:
@@ -168,16 +387,16 @@ class DiffParser:
         if not hunk:
             return None, 0, 0
         
+        # Every function pattern needs a '(' on the line, so a hunk without one
+        # can skip the join and the regex scans entirely
+        context_lines = hunk.get("context", [])
+        if not any('(' in line for line in context_lines):
+            return None, hunk["new_start"], hunk["new_start"] + hunk["new_count"]
+        
         # Look for function definitions in context
-        function_patterns = [
-            r'^\s*(?:async\s+)?def\s+(\w+)\s*\(',  # Python
-            r'^\s*(?:async\s+)?function\s+(\w+)\s*\(',  # JavaScript
-            r'^\s*(?:public|private|protected)?\s*\w+\s+(\w+)\s*\(',  # Java/C++
-        ]
-        
-        context = '\n'.join(hunk.get("context", []))
-        for pattern in function_patterns:
-            match = re.search(pattern, context, re.MULTILINE)
+        context = '\n'.join(context_lines)
+        for pattern in _FUNCTION_PATTERNS:
+            match = pattern.search(context)
             if match:
                 return match.group(1), hunk["new_start"], hunk["new_start"] + hunk["new_count"]
         
@@ -3,7 +3,9 @@ Email service for sending transactional emails with templates.
 Phase 3A: Security & Legal - Email verification, password reset, notifications.
 """
 
+import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from email.mime.text import MIMEText
@@ -22,6 +24,23 @@ logger = logging.getLogger(__name__)
 if aiosmtplib is None:
     logger.debug("aiosmtplib not installed. Email features will be unavailable.")
 
+# Idle connections older than this are probed with NOOP before reuse; most
+# SMTP servers drop idle sessions after a few minutes.
+SMTP_IDLE_CHECK_SECONDS = 60
+
+# (year, monotonic time it was computed) for the copyright footer
+_YEAR_CACHED: tuple[int, float] = (0, 0.0)
+_YEAR_REFRESH_SECONDS = 3600
+
+
+def _year() -> int:
+    """Current UTC year, recomputed at most once an hour."""
+    global _YEAR_CACHED
+    now = time.monotonic()
+    if now - _YEAR_CACHED[1] > _YEAR_REFRESH_SECONDS or not _YEAR_CACHED[0]:
+        _YEAR_CACHED = (datetime.utcnow().year, now)
+    return _YEAR_CACHED[0]
+
 
 # Email Templates (using Jinja2)
 
@@ -165,29 +184,31 @@ WELCOME_EMAIL_TEMPLATE = """
 </html>
 """
 
-NOTIFICATION_TEMPLATE = """
+# The notification email only substitutes three values, so it is a plain
+# str.format template rather than a Jinja2 one (CSS braces are doubled).
+_NOTIF_FMT = """
 <!DOCTYPE html>
 <html>
 <head>
     <style>
-        body { font-family: Arial, sans-serif; line-height: 1.6; color: #333; }
-        .container { max-width: 600px; margin: 0 auto; padding: 20px; }
-        .header { background: #6366F1; color: white; padding: 20px; text-align: center; }
-        .content { padding: 30px; background: #f9fafb; }
-        .button { display: inline-block; padding: 12px 24px; background: #6366F1; color: white; text-decoration: none; border-radius: 6px; margin: 20px 0; }
-        .footer { text-align: center; padding: 20px; color: #6b7280; font-size: 12px; }
+        body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; }}
+        .container {{ max-width: 600px; margin: 0 auto; padding: 20px; }}
+        .header {{ background: #6366F1; color: white; padding: 20px; text-align: center; }}
+        .content {{ padding: 30px; background: #f9fafb; }}
+        .button {{ display: inline-block; padding: 12px 24px; background: #6366F1; color: white; text-decoration: none; border-radius: 6px; margin: 20px 0; }}
+        .footer {{ text-align: center; padding: 20px; color: #6b7280; font-size: 12px; }}
     </style>
 </head>
 <body>
     <div class="container">
         <div class="header">
-            <h1>{{ subject }}</h1>
+            <h1>{subject}</h1>
         </div>
         <div class="content">
-            {{ content }}
+            {content}
         </div>
         <div class="footer">
-            <p>&copy; {{ year }} AI Code Review. All rights reserved.</p>
+            <p>&copy; {year} AI Code Review. All rights reserved.</p>
         </div>
     </div>
 </body>
@@ -202,6 +223,58 @@ class EmailService:
         self.enabled = settings.enable_email
         if not self.enabled:
             logger.info("Email service is disabled. Set ENABLE_EMAIL=true to enable.")
+        # Long-lived SMTP session so STARTTLS + AUTH are paid once, not per email
+        self._smtp: Optional["aiosmtplib.SMTP"] = None
+        self._smtp_lock = asyncio.Lock()
+        self._smtp_last_used = 0.0
+    
+    async def _connect_smtp(self) -> "aiosmtplib.SMTP":
+        """Open, upgrade and authenticate a new SMTP session."""
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.smtp_host,
+            port=settings.smtp_port,
+            use_tls=False,  # We'll use STARTTLS
+            start_tls=False,  # ...explicitly, below
+        )
+        await smtp.connect()
+        try:
+            await smtp.starttls()
+            await smtp.login(settings.smtp_username, settings.smtp_password)
+        except Exception:
+            smtp.close()
+            raise
+        return smtp
+    
+    async def _get_smtp(self) -> "aiosmtplib.SMTP":
+        """Return the shared SMTP session, reconnecting if it went away.
+        
+        Must be called with ``_smtp_lock`` held.
+        """
+        if self._smtp is not None and self._smtp.is_connected:
+            if time.monotonic() - self._smtp_last_used < SMTP_IDLE_CHECK_SECONDS:
+                return self._smtp
+            try:
+                await self._smtp.noop()
+                return self._smtp
+            except aiosmtplib.SMTPException:
+                logger.info("Idle SMTP connection went stale, reconnecting")
+        await self._reset_smtp()
+        self._smtp = await self._connect_smtp()
+        return self._smtp
+    
+    async def _reset_smtp(self):
+        """Drop the shared SMTP session (best-effort QUIT)."""
+        smtp, self._smtp = self._smtp, None
+        if smtp is not None and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
+    
+    async def close(self):
+        """Close the shared SMTP session."""
+        async with self._smtp_lock:
+            await self._reset_smtp()
     
     async def send_email(
         self,
@@ -231,16 +304,17 @@ class EmailService:
             html_part = MIMEText(html_content, "html")
             message.attach(html_part)
             
-            # Send via SMTP
-            async with aiosmtplib.SMTP(
-                hostname=settings.smtp_host,
-                port=settings.smtp_port,
-                use_tls=False,  # We'll use STARTTLS
-            ) as smtp:
-                await smtp.connect()
-                await smtp.starttls()
-                await smtp.login(settings.smtp_username, settings.smtp_password)
-                await smtp.send_message(message)
+            # Send via the shared SMTP session; retry once if the server hung up
+            async with self._smtp_lock:
+                try:
+                    smtp = await self._get_smtp()
+                    await smtp.send_message(message)
+                except aiosmtplib.SMTPServerDisconnected:
+                    logger.info("SMTP server disconnected, reconnecting and retrying")
+                    await self._reset_smtp()
+                    smtp = await self._get_smtp()
+                    await smtp.send_message(message)
+                self._smtp_last_used = time.monotonic()
             
             logger.info(f"Email sent successfully to {to_email}: {subject}")
             return True
@@ -263,7 +337,7 @@ class EmailService:
             name=name,
             verification_url=verification_url,
             expires_hours=settings.email_verification_token_expire_hours,
-            year=datetime.utcnow().year
+            year=_year()
         )
         
         return await self.send_email(
@@ -286,7 +360,7 @@ class EmailService:
             name=name,
             reset_url=reset_url,
             expires_hours=settings.password_reset_token_expire_hours,
-            year=datetime.utcnow().year
+            year=_year()
         )
         
         return await self.send_email(
@@ -306,7 +380,7 @@ class EmailService:
             name=name,
             dashboard_url=f"{settings.frontend_url}/dashboard",
             docs_url=f"{settings.frontend_url}/docs",
-            year=datetime.utcnow().year
+            year=_year()
         )
         
         return await self.send_email(
@@ -322,11 +396,10 @@ class EmailService:
         content: str
     ) -> bool:
         """Send a general notification email."""
-        template = Template(NOTIFICATION_TEMPLATE)
-        html_content = template.render(
+        html_content = _NOTIF_FMT.format(
             subject=subject,
             content=content,
-            year=datetime.utcnow().year
+            year=_year()
         )
         
         return await self.send_email(
@@ -8,9 +8,27 @@ in their account settings.
 
 import logging
 import secrets
+from itertools import islice
+from typing import Iterator
+
+import requests
+
+from app.services.github_service import detect_language
 
 logger = logging.getLogger(__name__)
 
+GITHUB_API_URL = "https://api.github.com"
+# Raw API reads reuse one keep-alive connection instead of a new TLS
+# handshake per request
+_github_session = requests.Session()
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    import json
+    _json_loads = json.loads
+
 try:
     from github import Github, GithubException
     HAS_PYGITHUB = True
@@ -31,6 +49,10 @@ class GitHubPATService:
             raise ValueError("GitHub Personal Access Token is required")
         self._token = token
         self._client = Github(token)
+        self._auth_headers = {
+            "Authorization": f"token {token}",
+            "Accept": "application/vnd.github+json",
+        }
 
     @property
     def client(self) -> Github:
@@ -81,10 +103,17 @@ class GitHubPATService:
         Returns:
             List of file change dictionaries with optional full content
         """
+        return list(self.iter_pr_diff(repo_full_name, pr_number, include_full_content))
+
+    def iter_pr_diff(self, repo_full_name: str, pr_number: int, include_full_content: bool = True) -> Iterator[dict]:
+        """Yield PR file changes one at a time as pages are fetched.
+
+        Consumers that process files incrementally never hold the whole
+        PR (which can be hundreds of files with full content) in memory.
+        """
         repo = self._client.get_repo(repo_full_name)
         pr = repo.get_pull(pr_number)
 
-        diff_data = []
         for file in pr.get_files():
             file_data = {
                 "filename": file.filename,
@@ -92,7 +121,7 @@ class GitHubPATService:
                 "additions": file.additions,
                 "deletions": file.deletions,
                 "changes": file.changes,
-                "patch": file.patch if hasattr(file, "patch") else None,
+                "patch": file.patch,
             }
             
             # Fetch full file content for better context
@@ -105,9 +134,7 @@ class GitHubPATService:
                     logger.warning(f"Failed to fetch full content for {file.filename}: {e}")
                     file_data["full_content"] = None
             
-            diff_data.append(file_data)
-
-        return diff_data
+            yield file_data
 
     def get_file_content(self, repo_full_name: str, file_path: str, ref: str = "main") -> str:
         """Fetch the full content of a file from a repository.
@@ -128,67 +155,45 @@ class GitHubPATService:
                 # It's a directory, not a file
                 return ""
                 
-            # Decode base64 content
-            import base64
-            content = base64.b64decode(file_content.content).decode("utf-8")
-            return content
+            # PyGithub decodes (and caches) the base64 payload for us
+            return file_content.decoded_content.decode("utf-8", errors="replace")
         except Exception as e:
             logger.error(f"Failed to fetch {file_path} at {ref}: {e}")
             return ""
 
     def _detect_language(self, filename: str) -> str:
         """Detect programming language from filename extension."""
-        ext_map = {
-            ".py": "python",
-            ".js": "javascript",
-            ".jsx": "javascript",
-            ".ts": "typescript",
-            ".tsx": "typescript",
-            ".java": "java",
-            ".cpp": "cpp",
-            ".c": "c",
-            ".h": "c",
-            ".hpp": "cpp",
-            ".go": "go",
-            ".rs": "rust",
-            ".rb": "ruby",
-            ".php": "php",
-            ".cs": "csharp",
-            ".swift": "swift",
-            ".kt": "kotlin",
-            ".scala": "scala",
-            ".sql": "sql",
-            ".sh": "bash",
-            ".yml": "yaml",
-            ".yaml": "yaml",
-            ".json": "json",
-            ".xml": "xml",
-            ".html": "html",
-            ".css": "css",
-            ".scss": "scss",
-            ".md": "markdown",
-        }
-        
-        for ext, lang in ext_map.items():
-            if filename.endswith(ext):
-                return lang
-        
-        return "unknown"
+        return detect_language(filename)
 
     def get_pr_info(self, repo_full_name: str, pr_number: int) -> dict:
-        """Get PR metadata."""
-        repo = self._client.get_repo(repo_full_name)
-        pr = repo.get_pull(pr_number)
+        """Get PR metadata.
+
+        Reads everything from a single GET /pulls/{n} response instead of
+        going through PyGithub's Repository/PullRequest objects, which cost an
+        extra round-trip for the repository lookup.
+        """
+        response = _github_session.get(
+            f"{GITHUB_API_URL}/repos/{repo_full_name}/pulls/{pr_number}",
+            headers=self._auth_headers,
+            timeout=30,
+        )
+        try:
+            pr = _json_loads(response.content) if response.content else None
+        except ValueError:
+            pr = None
+        if response.status_code >= 400:
+            # Same error type the PyGithub path raised
+            raise GithubException(response.status_code, pr, dict(response.headers))
 
         return {
-            "pr_number": pr.number,
-            "pr_url": pr.html_url,
-            "pr_title": pr.title,
-            "pr_author": pr.user.login if pr.user else "unknown",
-            "base_sha": pr.base.sha,
-            "head_sha": pr.head.sha,
-            "state": pr.state,
-            "repo_full_name": repo.full_name,
+            "pr_number": pr["number"],
+            "pr_url": pr["html_url"],
+            "pr_title": pr["title"],
+            "pr_author": (pr.get("user") or {}).get("login", "unknown"),
+            "base_sha": pr["base"]["sha"],
+            "head_sha": pr["head"]["sha"],
+            "state": pr["state"],
+            "repo_full_name": pr["base"]["repo"]["full_name"],
         }
 
     def get_pr_files(self, repo_full_name: str, pr_number: int) -> list:
@@ -212,7 +217,7 @@ class GitHubPATService:
         prs = repo.get_pulls(state="open", sort="updated", direction="desc")
 
         result = []
-        for pr in prs[:limit]:
+        for pr in islice(prs, limit):
             result.append({
                 "number": pr.number,
                 "title": pr.title,
@@ -256,6 +261,30 @@ class GitHubPATService:
         except Exception as e:
             logger.error(f"Failed to post review comment: {e}")
 
+    def submit_review(
+        self,
+        repo_full_name: str,
+        pr_number: int,
+        commit_sha: str,
+        comments: list,
+        body: str = "",
+        event: str = "COMMENT",
+    ):
+        """Post many inline comments as one pull request review.
+
+        `comments` holds {"path", "line", "body"} dicts. Errors propagate so
+        the caller can fall back to posting comments one by one.
+        """
+        repo = self._client.get_repo(repo_full_name)
+        pr = repo.get_pull(pr_number)
+        pr.create_review(
+            commit=repo.get_commit(commit_sha),
+            body=body,
+            event=event,
+            comments=comments,
+        )
+        logger.info(f"Posted review with {len(comments)} comments on PR #{pr_number}")
+
     def create_status_check(
         self,
         repo_full_name: str,
@@ -1,9 +1,23 @@
+import base64
+import functools
 import hmac
-import hashlib
+import json
+import os
+import re
+import threading
 import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 from pathlib import Path
+from typing import Iterator
+from urllib.parse import quote, urlencode
+
+import requests
 
 from app.config import settings
+from app.services.diff_parser import DiffParser
+from app.utils.cache import cache
 
 import logging
 
@@ -16,26 +30,210 @@ except ImportError:
     logger.info("PyJWT not installed; GitHub App JWT auth unavailable")
 
 try:
-    from github import Github, GithubIntegration
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+try:
+    from cryptography.hazmat.primitives import serialization
+except ImportError:
+    serialization = None  # type: ignore
+
+try:
+    from github import Github, GithubException
 except ImportError:
     Github = None  # type: ignore
-    GithubIntegration = None  # type: ignore
+    GithubException = Exception  # type: ignore
     logger.info("PyGithub not installed; GitHub API integration unavailable")
 
+GITHUB_API_URL = "https://api.github.com"
+# Token mints reuse one keep-alive connection to the API
+_github_session = requests.Session()
+
+# installation_id -> (token, expires_at epoch seconds). Installation tokens
+# live ~1 hour and GitHubService is constructed per event, so share them.
+_TOKEN_CACHE: dict[int, tuple[str, float]] = {}
+_TOKEN_CACHE_LOCK = threading.Lock()
+# Re-mint tokens this many seconds before GitHub expires them
+_TOKEN_REFRESH_MARGIN = 60
+# installation_id -> (token, Github). One client per installation token keeps
+# its pooled keep-alive connections to api.github.com across events.
+_CLIENT_CACHE: dict[int, tuple[str, "Github"]] = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
+# Repository objects are shared across GitHubService instances for this long
+_REPO_CACHE_TTL = 300
+# app_id -> (app JWT, exp epoch seconds). GitHub accepts an app JWT for 10
+# minutes, so one RS256 signature serves every installation in that window.
+_APP_JWT: dict[str, tuple[str, int]] = {}
+_APP_JWT_LOCK = threading.Lock()
+_APP_JWT_LIFETIME = 600
+# The webhook secret is fixed for the process; encode it once
+_WEBHOOK_SECRET_BYTES = settings.github_webhook_secret.encode('utf-8')
+# Concurrent file-content fetches per PR
+_CONTENT_FETCH_WORKERS = 8
+
+# "installation_id:URL" -> (etag, Link header, parsed body, body size) for
+# conditional GETs. Re-runs on the same commit revalidate with If-None-Match;
+# 304s don't count against the rate limit. Keyed per installation so one
+# installation's token never revalidates a body fetched under another's.
+_ETAG_CACHE: "OrderedDict[str, tuple[str, str, object, int]]" = OrderedDict()
+_ETAG_CACHE_LOCK = threading.Lock()
+_ETAG_CACHE_SIZE = 512
+# Bound on the summed size of cached bodies; bigger bodies are not cached
+_ETAG_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_ETAG_CACHE_MAX_BODY_BYTES = 1024 * 1024
+_etag_cache_bytes = 0
+# Page size for list endpoints (GitHub maximum)
+_PER_PAGE = 100
+# Blob lookups aliased into one GraphQL query; keeps each query well under
+# GitHub's node and response-size limits
+_GRAPHQL_BLOB_BATCH = 50
+
+
+_LINK_NEXT_RE = re.compile(r'<([^<>]+)>;\s*rel="next"')
+
+
+def _etag_cache_put(key: str, entry):
+    """Store an ETag cache entry, or drop the key when entry is None, then
+    evict the oldest entries until both the count and size bounds hold."""
+    global _etag_cache_bytes
+    with _ETAG_CACHE_LOCK:
+        old = _ETAG_CACHE.pop(key, None)
+        if old is not None:
+            _etag_cache_bytes -= old[3]
+        if entry is None:
+            return
+        _ETAG_CACHE[key] = entry
+        _etag_cache_bytes += entry[3]
+        while len(_ETAG_CACHE) > _ETAG_CACHE_SIZE or _etag_cache_bytes > _ETAG_CACHE_MAX_BYTES:
+            _, dropped = _ETAG_CACHE.popitem(last=False)
+            _etag_cache_bytes -= dropped[3]
+
+
+def _next_page_url(link_header: str):
+    """Return the rel="next" URL from a Link response header, if any."""
+    if not link_header:
+        return None
+    # "next" is normally the first segment, so try a cheap anchored match
+    match = _LINK_NEXT_RE.match(link_header) or _LINK_NEXT_RE.search(link_header)
+    return match.group(1) if match else None
+
+
+@functools.lru_cache(maxsize=4)
+def _load_signing_key(path: str):
+    """Read and parse the GitHub App PEM once per path.
+    
+    Every installation-token mint signs with this key (see
+    _mint_installation_token), so jwt.encode gets a parsed key object
+    and skips PEM parsing on each RS256 sign. Falls back to the PEM string
+    when cryptography is unavailable.
+    """
+    pem = Path(path).read_text(encoding='utf-8')
+    if serialization is None:
+        return pem
+    return serialization.load_pem_private_key(pem.encode('utf-8'), password=None)
+
+
+def _app_jwt(app_id: str, private_key_path: str) -> str:
+    """Return the app-level JWT, signing a new one only near expiry."""
+    if jwt is None:
+        raise RuntimeError("PyJWT is required for GitHub App authentication")
+    now = int(time.time())
+    with _APP_JWT_LOCK:
+        cached = _APP_JWT.get(app_id)
+        if cached and cached[1] - now > _TOKEN_REFRESH_MARGIN:
+            return cached[0]
+        exp = now + _APP_JWT_LIFETIME
+        token = jwt.encode(
+            {'iat': now, 'exp': exp, 'iss': app_id},
+            _load_signing_key(private_key_path),
+            algorithm='RS256',
+        )
+        _APP_JWT[app_id] = (token, exp)
+        return token
+
+
+def _mint_installation_token(app_id: str, private_key_path: str, installation_id: int) -> tuple[str, float]:
+    """Exchange the app JWT for an installation access token.
+    
+    Posts to the access_tokens endpoint directly rather than through
+    PyGithub's GithubIntegration, which signs a fresh JWT (and re-parses
+    the PEM) for every token it mints. Returns (token, expires_at epoch
+    seconds).
+    """
+    response = _github_session.post(
+        f"{GITHUB_API_URL}/app/installations/{installation_id}/access_tokens",
+        headers={
+            "Authorization": f"Bearer {_app_jwt(app_id, private_key_path)}",
+            "Accept": "application/vnd.github+json",
+        },
+        timeout=30,
+    )
+    response.raise_for_status()
+    data = _json_loads(response.content)
+    expires_at = data.get("expires_at")
+    if expires_at:
+        # ISO 8601 with a trailing Z, e.g. 2024-01-01T12:00:00Z
+        expires_ts = datetime.fromisoformat(expires_at.replace("Z", "+00:00")).timestamp()
+    else:
+        expires_ts = time.time() + 3600
+    return data["token"], expires_ts
+
+
+# File extension -> language, shared by the App and PAT services
+_EXT_MAP = {
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".java": "java",
+    ".cpp": "cpp",
+    ".c": "c",
+    ".h": "c",
+    ".hpp": "cpp",
+    ".go": "go",
+    ".rs": "rust",
+    ".rb": "ruby",
+    ".php": "php",
+    ".cs": "csharp",
+    ".swift": "swift",
+    ".kt": "kotlin",
+    ".scala": "scala",
+    ".sql": "sql",
+    ".sh": "bash",
+    ".yml": "yaml",
+    ".yaml": "yaml",
+    ".json": "json",
+    ".xml": "xml",
+    ".html": "html",
+    ".css": "css",
+    ".scss": "scss",
+    ".md": "markdown",
+}
+
+
+def detect_language(filename: str) -> str:
+    """Detect programming language from filename extension."""
+    return _EXT_MAP.get(os.path.splitext(filename)[1].lower(), "unknown")
+
 
 def verify_github_signature(payload_body: bytes, signature_header: str) -> bool:
     """Verify GitHub webhook signature"""
-    if not signature_header:
+    if not signature_header or not signature_header.startswith("sha256="):
         return False
     
-    hash_object = hmac.new(
-        settings.github_webhook_secret.encode('utf-8'),
-        msg=payload_body,
-        digestmod=hashlib.sha256
-    )
-    expected_signature = "sha256=" + hash_object.hexdigest()
+    try:
+        received = bytes.fromhex(signature_header[7:])
+    except ValueError:
+        return False
     
-    return hmac.compare_digest(expected_signature, signature_header)
+    # One-shot C implementation; skips building a Python HMAC object
+    expected = hmac.digest(_WEBHOOK_SECRET_BYTES, payload_body, "sha256")
+    
+    # Compare the raw 32-byte digests rather than 71-char hex strings
+    return hmac.compare_digest(expected, received)
 
 
 def parse_pr_event(payload: dict) -> dict:
@@ -62,6 +260,7 @@ class GitHubService:
     def __init__(self, installation_id: int):
         self.installation_id = installation_id
         self._github_client = None
+        self._repo_cache: dict = {}
         if not settings.enable_github_integration:
             raise RuntimeError("GitHub integration is disabled in this environment")
         private_key_path = settings.resolve_github_private_key_path()
@@ -72,34 +271,150 @@ class GitHubService:
         self._private_key_path = private_key_path
     
     def _get_installation_token(self) -> str:
-        """Generate installation access token"""
-        with open(self._private_key_path, 'r', encoding='utf-8') as key_file:
-            private_key = key_file.read()
-        
-        # Create JWT
-        payload = {
-            'iat': int(time.time()),
-            'exp': int(time.time()) + 600,  # 10 minutes
-            'iss': settings.github_app_id
-        }
+        """Return a cached installation access token, minting one if needed"""
+        with _TOKEN_CACHE_LOCK:
+            cached = _TOKEN_CACHE.get(self.installation_id)
+        if cached and cached[1] - time.time() > _TOKEN_REFRESH_MARGIN:
+            return cached[0]
         
-        jwt_token = jwt.encode(payload, private_key, algorithm='RS256')
-        
-        # Get installation token
-        integration = GithubIntegration(settings.github_app_id, private_key)
-        auth = integration.get_access_token(self.installation_id)
+        token, expires_ts = _mint_installation_token(
+            settings.github_app_id, self._private_key_path, self.installation_id
+        )
+        with _TOKEN_CACHE_LOCK:
+            _TOKEN_CACHE[self.installation_id] = (token, expires_ts)
         
-        return auth.token
+        return token
     
     @property
     def client(self) -> Github:
         """Get authenticated GitHub client"""
         if not self._github_client:
             token = self._get_installation_token()
-            self._github_client = Github(token)
+            with _CLIENT_CACHE_LOCK:
+                cached = _CLIENT_CACHE.get(self.installation_id)
+                if cached and cached[0] == token:
+                    client = cached[1]
+                else:
+                    # Size the connection pool for the concurrent content fetches
+                    client = Github(token, pool_size=_CONTENT_FETCH_WORKERS)
+                    _CLIENT_CACHE[self.installation_id] = (token, client)
+            self._github_client = client
         return self._github_client
     
-    def get_pr_diff(self, repo_full_name: str, pr_number: int, include_full_content: bool = True) -> str:
+    def _repo(self, repo_full_name: str):
+        """Get a Repository, avoiding a GET /repos/{owner}/{repo} per call.
+        
+        Cached on the instance and, for a few minutes, across instances of
+        the same installation.
+        """
+        repo = self._repo_cache.get(repo_full_name)
+        if repo is None:
+            key = f"github_repo:{self.installation_id}:{repo_full_name}"
+            cached = cache.get(key, ttl=_REPO_CACHE_TTL)
+            # A Repository carries its client's token; drop it once rotated
+            if cached is not None and cached[0] is self.client:
+                repo = cached[1]
+            else:
+                repo = self.client.get_repo(repo_full_name)
+                cache.set(key, (self.client, repo))
+            self._repo_cache[repo_full_name] = repo
+        return repo
+    
+    def _conditional_get(self, repo, url: str, params: dict = None):
+        """GET a JSON resource, revalidating any cached copy via its ETag.
+        
+        Returns (link_header, data). A 304 answer is served from the
+        module-level ETag cache.
+        """
+        key = f"{self.installation_id}:{url}"
+        if params:
+            key = f"{key}?{urlencode(sorted(params.items()))}"
+        with _ETAG_CACHE_LOCK:
+            cached = _ETAG_CACHE.get(key)
+        headers = {"If-None-Match": cached[0]} if cached else None
+        
+        status, response_headers, output = repo._requester.requestJson(
+            "GET", url, parameters=params, headers=headers
+        )
+        if status == 304 and cached:
+            with _ETAG_CACHE_LOCK:
+                # May have been evicted by another thread meanwhile
+                if key in _ETAG_CACHE:
+                    _ETAG_CACHE.move_to_end(key)
+            return cached[1], cached[2]
+        
+        data = _json_loads(output) if output else None
+        if status >= 400:
+            raise GithubException(status, data, response_headers)
+        
+        link = response_headers.get("link", "")
+        etag = response_headers.get("etag")
+        size = len(output or "")
+        if etag and size <= _ETAG_CACHE_MAX_BODY_BYTES:
+            _etag_cache_put(key, (etag, link, data, size))
+        elif cached:
+            # The cached copy is stale and its replacement isn't kept
+            _etag_cache_put(key, None)
+        return link, data
+    
+    def iter_pr_files(self, repo, pr_number: int) -> Iterator[dict]:
+        """Yield a PR's changed files as raw API dicts, page by page.
+        
+        Each page is handed out as soon as it arrives, so callers can start
+        on the first files before later pages are fetched.
+        """
+        url = f"{repo.url}/pulls/{pr_number}/files"
+        params = {"per_page": _PER_PAGE}
+        while url:
+            link, page = self._conditional_get(repo, url, params)
+            yield from page or []
+            # The next-page URL already carries its query string
+            url = _next_page_url(link)
+            params = None
+    
+    def _get_file_contents_graphql(self, repo, repo_full_name: str, ref: str, paths: list) -> dict:
+        """Fetch many file contents at one ref with batched GraphQL queries.
+        
+        Each path becomes an aliased `object(expression: "<ref>:<path>")`
+        lookup, so a whole PR costs one round-trip per batch instead of one
+        per file. Paths that come back binary, truncated or missing are left
+        out of the result for the caller to fetch over REST.
+        """
+        owner, name = repo_full_name.split("/", 1)
+        contents = {}
+        for offset in range(0, len(paths), _GRAPHQL_BLOB_BATCH):
+            batch = paths[offset:offset + _GRAPHQL_BLOB_BATCH]
+            variables = {"owner": owner, "name": name}
+            declarations = []
+            selections = []
+            for i, path in enumerate(batch):
+                variables[f"e{i}"] = f"{ref}:{path}"
+                declarations.append(f"$e{i}: String!")
+                selections.append(
+                    f"f{i}: object(expression: $e{i}) {{ ... on Blob {{ text isBinary isTruncated }} }}"
+                )
+            query = (
+                f"query($owner: String!, $name: String!, {', '.join(declarations)}) {{ "
+                f"repository(owner: $owner, name: $name) {{ {' '.join(selections)} }} }}"
+            )
+            
+            try:
+                _, result = repo._requester.requestJsonAndCheck(
+                    "POST", "/graphql", input={"query": query, "variables": variables}
+                )
+            except Exception as e:
+                logger.warning(f"GraphQL content fetch failed, falling back to REST: {e}")
+                return contents
+            
+            repository = ((result or {}).get("data") or {}).get("repository") or {}
+            for i, path in enumerate(batch):
+                blob = repository.get(f"f{i}")
+                if blob and blob.get("text") is not None and not blob.get("isBinary") \
+                        and not blob.get("isTruncated"):
+                    contents[path] = blob["text"]
+        return contents
+    
+    def get_pr_diff(self, repo_full_name: str, pr_number: int, include_full_content: bool = True) -> list:
         """Get PR diff with optional full file content.
         
         Args:
@@ -110,52 +425,106 @@ class GitHubService:
         Returns:
             List of file diffs with optional full content
         """
-        repo = self.client.get_repo(repo_full_name)
-        pr = repo.get_pull(pr_number)
+        repo = self._repo(repo_full_name)
+        _, pr = self._conditional_get(repo, f"{repo.url}/pulls/{pr_number}")
+        head_sha = pr["head"]["sha"]
+        
+        if not include_full_content:
+            return self._build_diff_data(list(self.iter_pr_files(repo, pr_number)), {})
         
-        # Get diff
-        files = pr.get_files()
-        diff_data = []
+        # Fetch full file content for better context while the file list is
+        # still paging in: each GraphQL batch starts as soon as enough files
+        # have arrived, overlapping content lookups with the next pages
+        files = []
+        contents = {}
+        with ThreadPoolExecutor(max_workers=_CONTENT_FETCH_WORKERS) as pool:
+            jobs = []
+            pending = []
+            for f in self.iter_pr_files(repo, pr_number):
+                files.append(f)
+                pending.append(f)
+                if len(pending) == _GRAPHQL_BLOB_BATCH:
+                    jobs.append(pool.submit(self._fetch_file_contents, repo, repo_full_name, head_sha, pending))
+                    pending = []
+            if pending:
+                jobs.append(pool.submit(self._fetch_file_contents, repo, repo_full_name, head_sha, pending))
+            
+            missing = []
+            for job in jobs:
+                batch_contents, batch_missing = job.result()
+                contents.update(batch_contents)
+                missing.extend(batch_missing)
+            
+            # Binary, truncated or failed lookups go through REST
+            if missing:
+                fetched = pool.map(
+                    lambda path: self.get_file_content(repo_full_name, path, head_sha),
+                    missing,
+                )
+                contents.update(zip(missing, fetched))
         
-        for file in files:
+        return self._build_diff_data(files, contents)
+    
+    def _fetch_file_contents(self, repo, repo_full_name: str, ref: str, files: list) -> tuple[dict, list]:
+        """Contents for a batch of changed files: from the patch for new
+        files, else one GraphQL query. Returns (contents, paths still missing)."""
+        contents, eligible = self._contents_from_patches(files)
+        if eligible:
+            contents.update(self._get_file_contents_graphql(repo, repo_full_name, ref, eligible))
+        return contents, [path for path in eligible if path not in contents]
+    
+    @staticmethod
+    def _contents_from_patches(files: list) -> tuple[dict, list]:
+        """Split changed files into contents recoverable from their patch and
+        paths that still need fetching. Removed files need neither."""
+        contents = {}
+        eligible = []
+        for f in files:
+            if f["status"] == "removed":
+                continue
+            if f["status"] == "added":
+                content = DiffParser.reconstruct_new_file(f.get("patch"))
+                if content is not None:
+                    contents[f["filename"]] = content
+                    continue
+            eligible.append(f["filename"])
+        return contents, eligible
+    
+    def _build_diff_data(self, files: list, contents: dict) -> list:
+        """Shape raw PR file dicts into the diff_data list the analyzers expect"""
+        # Size is known up front; fill in place rather than growing the list
+        diff_data = [None] * len(files)
+        for i, file in enumerate(files):
+            filename = file["filename"]
             file_info = {
-                "filename": file.filename,
-                "status": file.status,
-                "additions": file.additions,
-                "deletions": file.deletions,
-                "changes": file.changes,
-                "patch": file.patch if hasattr(file, 'patch') else None
+                "filename": filename,
+                "status": file["status"],
+                "additions": file["additions"],
+                "deletions": file["deletions"],
+                "changes": file["changes"],
+                "patch": file.get("patch")
             }
             
-            # Optionally fetch full file content for better context
-            if include_full_content and file.status != "removed":
-                try:
-                    full_content = self.get_file_content(repo_full_name, file.filename, pr.head.sha)
-                    file_info["full_content"] = full_content
-                    file_info["language"] = self._detect_language(file.filename)
-                except Exception as e:
-                    logger.warning(f"Could not fetch full content for {file.filename}: {e}")
-                    file_info["full_content"] = None
-                    file_info["language"] = self._detect_language(file.filename)
+            if filename in contents:
+                file_info["full_content"] = contents[filename]
+                file_info["language"] = self._detect_language(filename)
             
-            diff_data.append(file_info)
+            diff_data[i] = file_info
         
         return diff_data
     
     def get_pr_files(self, repo_full_name: str, pr_number: int) -> list:
         """Get list of files changed in PR"""
-        repo = self.client.get_repo(repo_full_name)
-        pr = repo.get_pull(pr_number)
-        files = pr.get_files()
+        repo = self._repo(repo_full_name)
         
         return [
             {
-                "filename": f.filename,
-                "status": f.status,
-                "additions": f.additions,
-                "deletions": f.deletions
+                "filename": f["filename"],
+                "status": f["status"],
+                "additions": f["additions"],
+                "deletions": f["deletions"]
             }
-            for f in files
+            for f in self.iter_pr_files(repo, pr_number)
         ]
     
     def get_file_content(self, repo_full_name: str, file_path: str, ref: str = "main") -> str:
@@ -170,63 +539,36 @@ class GitHubService:
             File content as string
         """
         try:
-            repo = self.client.get_repo(repo_full_name)
-            file_content = repo.get_contents(file_path, ref=ref)
+            repo = self._repo(repo_full_name)
+            _, file_content = self._conditional_get(
+                repo, f"{repo.url}/contents/{quote(file_path)}", {"ref": ref}
+            )
             
             if isinstance(file_content, list):
                 # It's a directory, not a file
                 return ""
                 
-            # Decode base64 content
-            import base64
-            content = base64.b64decode(file_content.content).decode("utf-8")
-            return content
+            encoded = file_content.get("content")
+            if not encoded and file_content.get("size", 0) > 0:
+                # Files over 1MB come back without content; the blobs API
+                # serves them (up to 100MB) by SHA
+                _, blob = self._conditional_get(
+                    repo, f"{repo.url}/git/blobs/{file_content['sha']}"
+                )
+                encoded = blob.get("content", "")
+            
+            return base64.b64decode(encoded or "").decode("utf-8")
         except Exception as e:
             logger.error(f"Failed to fetch {file_path} at {ref}: {e}")
             return ""
 
     def _detect_language(self, filename: str) -> str:
         """Detect programming language from filename extension."""
-        ext_map = {
-            ".py": "python",
-            ".js": "javascript",
-            ".jsx": "javascript",
-            ".ts": "typescript",
-            ".tsx": "typescript",
-            ".java": "java",
-            ".cpp": "cpp",
-            ".c": "c",
-            ".h": "c",
-            ".hpp": "cpp",
-            ".go": "go",
-            ".rs": "rust",
-            ".rb": "ruby",
-            ".php": "php",
-            ".cs": "csharp",
-            ".swift": "swift",
-            ".kt": "kotlin",
-            ".scala": "scala",
-            ".sql": "sql",
-            ".sh": "bash",
-            ".yml": "yaml",
-            ".yaml": "yaml",
-            ".json": "json",
-            ".xml": "xml",
-            ".html": "html",
-            ".css": "css",
-            ".scss": "scss",
-            ".md": "markdown",
-        }
-        
-        for ext, lang in ext_map.items():
-            if filename.endswith(ext):
-                return lang
-        
-        return "unknown"
+        return detect_language(filename)
     
     def post_pr_comment(self, repo_full_name: str, pr_number: int, body: str):
         """Post a comment on PR"""
-        repo = self.client.get_repo(repo_full_name)
+        repo = self._repo(repo_full_name)
         pr = repo.get_pull(pr_number)
         pr.create_issue_comment(body)
         logger.info(f"Posted comment on PR #{pr_number}")
@@ -241,7 +583,7 @@ class GitHubService:
         body: str
     ):
         """Post an inline review comment on specific line"""
-        repo = self.client.get_repo(repo_full_name)
+        repo = self._repo(repo_full_name)
         pr = repo.get_pull(pr_number)
         
         try:
@@ -255,6 +597,30 @@ class GitHubService:
         except Exception as e:
             logger.error(f"Failed to post review comment: {e}")
     
+    def submit_review(
+        self,
+        repo_full_name: str,
+        pr_number: int,
+        commit_sha: str,
+        comments: list,
+        body: str = "",
+        event: str = "COMMENT"
+    ):
+        """Post many inline comments as one pull request review.
+        
+        `comments` holds {"path", "line", "body"} dicts. One POST replaces a
+        request per comment. GitHub rejects the whole review if any line is
+        outside the diff, so errors propagate for the caller to fall back on.
+        """
+        repo = self._repo(repo_full_name)
+        payload = {"commit_id": commit_sha, "event": event, "comments": comments}
+        if body:
+            payload["body"] = body
+        repo._requester.requestJsonAndCheck(
+            "POST", f"{repo.url}/pulls/{pr_number}/reviews", input=payload
+        )
+        logger.info(f"Posted review with {len(comments)} comments on PR #{pr_number}")
+    
     def create_status_check(
         self,
         repo_full_name: str,
@@ -264,7 +630,7 @@ class GitHubService:
         context: str = "AI Code Review"
     ):
         """Create a status check on commit"""
-        repo = self.client.get_repo(repo_full_name)
+        repo = self._repo(repo_full_name)
         commit = repo.get_commit(commit_sha)
         
         commit.create_status(
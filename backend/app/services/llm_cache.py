@@ -0,0 +1,119 @@
+"""
+Persistent LLM response cache.
+
+CI retries, re-runs and rebase pushes resend prompts that are byte-for-byte
+identical to earlier ones. Responses are stored in SQLite, keyed by a
+SHA-256 of (model, system prompt, prompt), so those runs skip the provider
+round-trip entirely. LLMService also stores parsed per-file findings here
+under "findings:" keys. SQLite keeps the cache shared between Celery workers
+on the same host without requiring Redis.
+"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Expired and over-cap rows are trimmed once per this many writes rather
+# than on every insert
+_TRIM_EVERY_WRITES = 100
+
+
+class LLMResponseCache:
+    """Thread-safe SQLite store of LLM responses with a TTL and a row cap"""
+
+    def __init__(self, path: str, ttl_seconds: int, max_entries: int = 0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        # WAL lets several worker processes read while one writes
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_created_at ON llm_cache (created_at)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, system: str, prompt: str) -> str:
+        """Hash everything that determines the response into a cache key"""
+        return hashlib.sha256(f"{model}\n{system}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return a cached response younger than the TTL, if any"""
+        cutoff = int(time.time()) - self.ttl_seconds
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT response FROM llm_cache WHERE key = ? AND created_at >= ?",
+                    (key, cutoff),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def set(self, key: str, response: str):
+        """Store a response, replacing any older entry for the key"""
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, int(time.time())),
+                )
+                self._writes += 1
+                if self._writes % _TRIM_EVERY_WRITES == 0:
+                    self._trim()
+                self._conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def _trim(self):
+        """Drop expired rows, then the oldest rows beyond max_entries.
+
+        Caller holds the lock. Reads don't refresh rows, so "oldest" is by
+        write time; with a TTL in place that's close enough to LRU.
+        """
+        cutoff = int(time.time()) - self.ttl_seconds
+        self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (cutoff,))
+        if self.max_entries > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                "SELECT key FROM llm_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Get or create the response cache singleton; None when disabled"""
+    global _llm_cache
+    if settings.llm_cache_ttl_seconds <= 0:
+        return None
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                try:
+                    _llm_cache = LLMResponseCache(
+                        settings.llm_cache_path,
+                        settings.llm_cache_ttl_seconds,
+                        settings.llm_cache_max_entries,
+                    )
+                except sqlite3.Error as e:
+                    logger.warning(f"LLM response cache unavailable: {e}")
+                    return None
+    return _llm_cache
@@ -1,12 +1,449 @@
 from app.config import settings
 from app.models import FindingSeverity, FindingCategory
 from app.services.ast_analyzer import get_ast_analyzer
+from app.services.diff_parser import DiffParser
+from app.services.llm_cache import LLMResponseCache, get_llm_cache
+import bisect
+import functools
+import hashlib
 import logging
 import json
+import random
+import re
 import requests
+from requests.adapters import HTTPAdapter
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from types import MappingProxyType
+from typing import Annotated, Optional
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+except ImportError:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode("utf-8")
+
+# msgspec validates a well-formed findings array and builds the items in one
+# C pass. Without it, or when any item is off-schema, items are checked one by one.
+try:
+    import msgspec
+
+    class _LLMFinding(msgspec.Struct):
+        title: Annotated[str, msgspec.Meta(min_length=1)]
+        description: Annotated[str, msgspec.Meta(min_length=1)]
+        line_number: int = 0
+        severity: str = "medium"
+        category: str = "bug"
+        suggestion: str = ""
+        file_path: Optional[str] = None
+
+    def _convert_llm_findings(data):
+        return msgspec.convert(data, list[_LLMFinding])
+
+    _MsgspecDecodeError = msgspec.DecodeError
+except ImportError:
+    _convert_llm_findings = None
+    _MsgspecDecodeError = ()
 
 logger = logging.getLogger(__name__)
 
+# Per-file LLM calls are network-bound and independent, so run a few at once.
+# One pool is shared by every analysis in the process: concurrent PRs queue
+# behind each other instead of multiplying the load on provider rate limits.
+_LLM_POOL = ThreadPoolExecutor(
+    max_workers=max(1, settings.llm_concurrency), thread_name_prefix="llm"
+)
+
+# gpt-4o is the smallest step up from gpt-4-turbo that supports strict
+# json_schema structured outputs
+_OPENAI_MODEL = "gpt-4o"
+_ANTHROPIC_MODEL = "claude-sonnet-4-20250514"
+_GEMINI_MODEL = "gemini-1.5-flash"
+
+# Cheaper first-pass models for LLM_TRIAGE; a file is re-reviewed with the
+# full model only when triage reports a critical or high finding. Groq
+# already serves a small model, so it has no separate triage tier.
+_TRIAGE_MODELS = {
+    "openai": "gpt-4o-mini",
+    "anthropic": "claude-3-5-haiku-20241022",
+    "google": "gemini-1.5-flash-8b",
+}
+_ESCALATE_SEVERITIES = frozenset({FindingSeverity.CRITICAL, FindingSeverity.HIGH})
+
+_REVIEW_SYSTEM_PROMPT = "You are an expert code reviewer specializing in security, performance, and correctness. Respond only with valid JSON arrays."
+
+# Review prompts are constant apart from a few fields; keeping them as
+# module-level str.format templates avoids rebuilding kilobytes of
+# boilerplate through f-string evaluation for every file.
+#
+# The instructions come first and never vary, so every per-file prompt
+# shares a byte-identical prefix. Provider calls send it as the system
+# message (see _split_review_prompt) and the per-file part (filename,
+# context, diff) as the user message.
+_ANALYSIS_INSTRUCTIONS = """You are an expert code reviewer with deep knowledge of software engineering best practices, security vulnerabilities, and performance optimization.
+
+**Analysis Objectives:**
+1. **Logic & Correctness**: Identify bugs, incorrect logic, edge cases, off-by-one errors
+2. **Security**: Find vulnerabilities beyond simple patterns (auth bypasses, race conditions, TOCTOU, injection flaws, etc.)
+3. **Performance**: Detect inefficient algorithms, N+1 queries, memory leaks, unnecessary computations
+4. **Concurrency**: Identify race conditions, deadlock risks, thread-safety issues
+5. **Error Handling**: Gaps in error recovery, unhandled edge cases, resource leaks
+6. **Maintainability**: Complex code, poor naming, missing documentation for complex logic
+7. **Cross-file Impact**: Consider how changes might break other files that use this code
+
+**Context:**
+- You have access to the full file context and code structure (AST)
+- Focus on issues that require deep reasoning and understanding of the broader codebase
+- Ignore trivial style issues already caught by linters
+
+**Example Quality Findings:**
+
+```json
+[
+  {
+    "line_number": 15,
+    "severity": "high",
+    "category": "bug",
+    "title": "Race condition in concurrent access",
+    "description": "The counter variable is accessed by multiple threads without synchronization. Two threads could read the same value simultaneously, increment it, and write back, resulting in lost updates.",
+    "suggestion": "Use threading.Lock() or atomic operations (threading.local, queue.Queue) to protect the counter variable."
+  },
+  {
+    "line_number": 42,
+    "severity": "medium",
+    "category": "performance",
+    "title": "N+1 query in loop",
+    "description": "The code fetches user details inside a loop for each post, resulting in N+1 database queries. For 1000 posts, this would execute 1001 queries.",
+    "suggestion": "Use select_related() or prefetch_related() to fetch users in a single query, or restructure to use a JOIN."
+  },
+  {
+    "line_number": 67,
+    "severity": "critical",
+    "category": "security",
+    "title": "Time-of-check to time-of-use (TOCTOU) vulnerability",
+    "description": "The code checks if file exists, then opens it later. An attacker could replace the file with a symlink to sensitive data between the check and use.",
+    "suggestion": "Open the file once with error handling, or use os.open() with O_EXCL|O_CREAT to prevent TOCTOU attacks."
+  }
+]
+```
+
+**Output Format:**
+Return a valid JSON array of findings. Each finding must have:
+- line_number: Integer (use best estimate from diff context)
+- severity: One of ["critical", "high", "medium", "low"]
+- category: One of ["bug", "security", "performance", "best_practice"]
+- title: String (concise, under 80 chars)
+- description: String (detailed explanation with impact)
+- suggestion: String (specific, actionable fix)
+
+**Guidelines:**
+- Only report significant issues (not cosmetic)
+- Be specific with line numbers based on the diff
+- Use the full file context to understand impact on other functions/classes
+- Include WHY it's a problem, not just WHAT
+- Provide actionable suggestions
+- If no issues found, return: []
+- Return ONLY the JSON array, no markdown formatting
+"""
+
+_ANALYSIS_FILE_TEMPLATE = """File: {filename}
+
+{context_block}
+
+**Code Changes (Diff):**
+```
+{patch}
+```
+
+Rule-based static analysis already detected {rule_finding_count} issues in this file."""
+
+_ANALYSIS_PROMPT_TEMPLATE = """
+{file_section}
+
+Your JSON response:
+"""
+
+# Several small files reviewed in one request share the instruction prefix
+# and a single round-trip; findings are attributed back by file_path
+_BUNDLE_PROMPT_TEMPLATE = """
+This Pull Request changes {file_count} small files, each shown under its own "=== FILE: ... ===" header. Review every file separately, and give each finding a file_path: the exact file name from its header.
+
+{file_sections}
+
+Your JSON response:
+"""
+
+# Same layout as the per-file prompts: the static instructions lead so
+# cross-file prompts share a cacheable prefix, and only the file overview
+# is formatted in after them
+_CROSS_FILE_INSTRUCTIONS = """You are an expert code reviewer analyzing cross-file impact in a Pull Request. The changed files are listed in the user's message.
+
+**Analysis Objectives:**
+
+Identify issues that span multiple files:
+
+1. **Breaking Changes**: 
+   - Function/method signature changes without updating callers
+   - Renamed classes/functions not updated across imports
+   - Removed exports still being imported elsewhere
+
+2. **Inconsistent Updates**:
+   - Related files that should be updated together but weren't
+   - Similar patterns changed in one file but not others
+   - Configuration files out of sync
+
+3. **Dependency Issues**:
+   - Circular dependencies introduced
+   - Missing imports after refactoring
+   - Import paths that might break after file moves
+
+4. **Missing Tests**:
+   - Code changes without corresponding test updates
+   - New functions/classes without test coverage
+
+**Example Quality Findings:**
+
+```json
+[
+  {
+    "line_number": 0,
+    "severity": "high",
+    "category": "bug",
+    "title": "Function signature changed without updating callers",
+    "description": "File A modified calculateTotal() to require 2 parameters instead of 1, but File B (which imports and calls this function) was not updated. This will cause runtime errors.",
+    "suggestion": "Update all call sites in File B to pass the new required parameter."
+  },
+  {
+    "line_number": 0,
+    "severity": "medium",
+    "category": "best_practice",
+    "title": "Missing test updates for new authentication logic",
+    "description": "auth.py was modified to add two-factor authentication, but auth_test.py was not updated with corresponding test cases.",
+    "suggestion": "Add test cases in auth_test.py to verify 2FA login flow and failure scenarios."
+  }
+]
+```
+
+**Output Format:**
+Return a valid JSON array of cross-file findings. Use line_number: 0 for multi-file issues.
+
+Return ONLY the JSON array, no markdown formatting. If no cross-file issues found, return: []
+"""
+
+_CROSS_FILE_PROMPT_TEMPLATE = """
+**Files Changed ({file_count}):**
+
+{files_overview}
+
+Your JSON response:
+"""
+
+# Structured-output schema for review findings. Providers that enforce it
+# always return parseable JSON, so there's no fence stripping or retrying
+# for malformed output. Strict mode needs an object at the top level.
+_FINDING_PROPERTIES = {
+    "line_number": {"type": "integer"},
+    "severity": {"type": "string", "enum": ["critical", "high", "medium", "low"]},
+    "category": {"type": "string", "enum": ["bug", "security", "performance", "best_practice"]},
+    "title": {"type": "string"},
+    "description": {"type": "string"},
+    "suggestion": {"type": "string"},
+}
+
+
+def _findings_schema(properties: dict) -> dict:
+    """Strict {"findings": [...]} schema whose items have exactly `properties`"""
+    return {
+        "type": "object",
+        "properties": {
+            "findings": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": list(properties),
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["findings"],
+        "additionalProperties": False,
+    }
+
+
+FINDINGS_SCHEMA = _findings_schema(_FINDING_PROPERTIES)
+# Multi-file requests also say which file each finding belongs to
+BUNDLE_FINDINGS_SCHEMA = _findings_schema({"file_path": {"type": "string"}, **_FINDING_PROPERTIES})
+
+# Lower-cased model labels -> enums, shared read-only by every parse
+_SEVERITY_MAP = MappingProxyType({
+    "critical": FindingSeverity.CRITICAL,
+    "high": FindingSeverity.HIGH,
+    "medium": FindingSeverity.MEDIUM,
+    "low": FindingSeverity.LOW
+})
+
+_CATEGORY_MAP = MappingProxyType({
+    "bug": FindingCategory.BUG,
+    "security": FindingCategory.SECURITY,
+    "performance": FindingCategory.PERFORMANCE,
+    "best_practice": FindingCategory.BEST_PRACTICE
+})
+
+# Filename fragments that mark a high-blast-radius change, matched as one
+# case-insensitive alternation instead of a substring scan per pattern
+_SENSITIVE_PATTERNS = (
+    "auth", "security", "password", "token", "key", "secret",
+    "payment", "billing", "database", "migration", "config",
+    ".env", "docker", "ci", "deploy", "infra",
+)
+SENSITIVE_FILE_RE = re.compile("|".join(map(re.escape, _SENSITIVE_PATTERNS)), re.IGNORECASE)
+
+# Outermost {...} in a raw reply, wherever the model put prose or fences
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+# Where a findings array can start: "[" opening an object or closing at
+# once. Prose such as "Issues found [2]:" or "see [docs]" doesn't match.
+_FINDINGS_ARRAY_START_RE = re.compile(r"\[\s*[{\]]")
+# Decodes one JSON value from an offset and ignores whatever follows it
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE_RE = re.compile(r"[ \t\n\r]*")
+# Body of the first ``` fence (any info string); an unclosed fence runs to the end
+_FENCED_BLOCK_RE = re.compile(r"```[^\n]*\n(.*?)(?:\n```|\Z)", re.DOTALL)
+
+# Circuit breaker: after this many consecutive failures a provider is
+# skipped for the cooldown, so one outage doesn't stall every analysis
+_BREAKER_THRESHOLD = 3
+_BREAKER_COOLDOWN_SECONDS = 30
+# "provider:key fingerprint" -> {"failures": int, "open_until": monotonic ts}.
+# Keyed per API key because rate limits are per key, not per provider.
+_breakers: dict = {}
+_breakers_lock = threading.Lock()
+
+
+class _TokenBucket:
+    """Thread-safe token bucket pacing requests to a per-minute rate.
+    
+    Up to a sixth of a minute's allowance may go out in a burst; after
+    that acquire() blocks until a token refills, so calls are spread out
+    before the provider starts answering 429.
+    """
+    
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, per_minute / 6.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# Same "provider:key fingerprint" keys as the breakers: limits are per key
+_rate_limiters: dict = {}
+_rate_limiters_lock = threading.Lock()
+
+# SDK clients by provider and full key hash. Each holds its own connection
+# pool, and an LLMService is built per analysis, so sharing them lets later
+# runs for the same key reuse warm TLS connections instead of handshaking
+# again. The full hash matters here: a client carries its key.
+_sdk_clients: "OrderedDict[str, object]" = OrderedDict()
+_sdk_clients_lock = threading.Lock()
+_SDK_CLIENTS_SIZE = 64
+
+
+def _shared_client(provider: str, secret: str, factory):
+    """Return the cached SDK client for (provider, secret), creating it with factory()"""
+    client_id = f"{provider}:{hashlib.sha256(secret.encode()).hexdigest()}"
+    with _sdk_clients_lock:
+        client = _sdk_clients.get(client_id)
+        if client is not None:
+            _sdk_clients.move_to_end(client_id)
+            return client
+        client = _sdk_clients[client_id] = factory()
+        if len(_sdk_clients) > _SDK_CLIENTS_SIZE:
+            # Dropped rather than closed: another thread may still be using it
+            _sdk_clients.popitem(last=False)
+        return client
+
+# Shared keep-alive pool for Gemini REST calls; a bare requests.post pays a
+# fresh TCP + TLS handshake every time
+_gemini_session = requests.Session()
+_gemini_session.mount(
+    "https://", HTTPAdapter(pool_connections=4, pool_maxsize=max(1, settings.llm_concurrency) * 2)
+)
+_gemini_session.headers["Content-Type"] = "application/json"
+# The key travels in a header, so the URL only varies by model
+_GEMINI_STREAM_URL = (
+    "https://generativelanguage.googleapis.com/v1beta/models/"
+    "{model}:streamGenerateContent?alt=sse"
+)
+
+# (sha256(content), language) -> AST analysis. The cross-file pass and the
+# per-file prompts parse the same files; CI re-runs parse them again.
+_AST_CACHE: "OrderedDict[tuple[str, str], dict]" = OrderedDict()
+_AST_CACHE_LOCK = threading.Lock()
+_AST_CACHE_SIZE = 256
+
+# Patches as sent to the model (compressed, then cut to the line and token
+# budgets), keyed by a hash of the raw patch. Batch fallbacks and reruns
+# rebuild the same sections; tokenizing a long patch is the costly part.
+_TRIMMED_PATCH_CACHE: "OrderedDict[str, str]" = OrderedDict()
+_TRIMMED_PATCH_CACHE_LOCK = threading.Lock()
+_TRIMMED_PATCH_CACHE_SIZE = 256
+
+# Cap on source lines sent for changed functions in one file prompt
+_MAX_CHANGED_FUNCTION_LINES = 200
+
+# Unchanged diff lines kept around each change in prompts. GitHub patches
+# already carry 3; the changed-function bodies give wider context.
+_PATCH_CONTEXT_LINES = 2
+
+# Per-file output budget: a base for the JSON envelope plus room for each
+# expected finding. Decode time grows with generated tokens, and most
+# files produce only a handful of findings. A finding with a full
+# description and suggestion runs to ~400 tokens, and a reply cut off
+# mid-array loses whatever didn't fit, so no request gets less than the floor.
+_BASE_RESPONSE_TOKENS = 150
+_TOKENS_PER_FINDING = 400
+_MAX_ESTIMATED_FINDINGS = 8
+_MIN_RESPONSE_TOKENS = 1000
+
+# Batch API polling (only used when USE_LLM_BATCH_API is enabled)
+_BATCH_POLL_SECONDS = 5
+# Below this many files the batch round-trip isn't worth the polling delay
+_BATCH_MIN_FILES = 3
+
+# Small files are reviewed several to a request (LLM_MAX_FILES_PER_CALL);
+# only changes under this many lines qualify
+_BUNDLE_MAX_CHANGED_LINES = 200
+# Output cap for a bundled request, however many findings it expects
+_BUNDLE_MAX_TOKENS = 4000
+
+# Parsed per-file findings are cached under this version as well as the
+# file's content, patch and rule-finding count. Bump it whenever the review
+# prompt or _parse_llm_response changes so stale findings stop matching.
+_FINDINGS_CACHE_VERSION = "v2"
+# Findings reused from the same patch at other lines (LLM_REUSE_MOVED_FINDINGS)
+# must also match the file content this many lines around each hunk
+_MOVED_FINDINGS_CONTEXT_LINES = 20
+
 # ─── LAZY IMPORTS — no module-level imports of heavy AI libraries ───
 # These are checked/imported only when LLMService is instantiated
 _openai_checked = False
@@ -51,6 +488,531 @@ def _ensure_anthropic():
     return HAS_ANTHROPIC
 
 
+def _is_openai_rate_limit(exc: Exception) -> bool:
+    return openai is not None and isinstance(exc, openai.RateLimitError)
+
+
+def _is_anthropic_overload(exc: Exception) -> bool:
+    if getattr(exc, "status_code", None) in (429, 529):
+        return True
+    message = str(exc).lower()
+    return "rate" in message or "overloaded" in message
+
+
+def _is_groq_rate_limit(exc: Exception) -> bool:
+    if getattr(exc, "status_code", None) == 429:
+        return True
+    message = str(exc).lower()
+    return "rate" in message or "limit" in message
+
+
+# Longest Retry-After we'll sleep for inside a worker; beyond this the
+# fallback chain moves on to the next provider sooner
+_MAX_RETRY_AFTER_SECONDS = 30.0
+
+
+def _retry_after_seconds(exc: Exception):
+    """Seconds from a 429's Retry-After header (SDK errors carry the
+    HTTP response), or None when absent or not a number of seconds"""
+    headers = getattr(getattr(exc, "response", None), "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(0.0, float(headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_with_backoff(provider: str, retriable, max_retries: int = 3, base: float = 2.0):
+    """Retry a provider call on rate limiting with jittered exponential backoff.
+    
+    `retriable` is a predicate on the raised exception; anything else is
+    logged and re-raised immediately. The jitter keeps concurrent workers
+    that hit a limit together from retrying in lockstep. When the provider
+    says how long to wait (Retry-After) that is used instead, up to a cap,
+    so retries neither come back too early nor sit out a long guess.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            for attempt in range(max_retries):
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if not retriable(e):
+                        logger.error(f"{provider} API error: {e}")
+                        raise
+                    if attempt == max_retries - 1:
+                        raise
+                    delay = _retry_after_seconds(e)
+                    if delay is None:
+                        delay = base * (2 ** attempt) + random.uniform(0, base)
+                    else:
+                        delay = min(delay, _MAX_RETRY_AFTER_SECONDS) + random.uniform(0, 0.5)
+                    logger.warning(f"{provider} rate limit, retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                    time.sleep(delay)
+        return wrapper
+    return decorator
+
+
+_token_encoder = None
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Trim text to roughly max_tokens so prompts don't overflow the context.
+    
+    Counts with tiktoken when it's installed, else estimates ~4 chars/token.
+    """
+    global _token_encoder
+    if not text or max_tokens <= 0:
+        return text
+    # Cheap exit: well under budget even at one token per char
+    if len(text) <= max_tokens:
+        return text
+    
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _token_encoder = False
+    
+    if _token_encoder:
+        tokens = _token_encoder.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return _token_encoder.decode(tokens[:max_tokens]) + "\n...[truncated]"
+    
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n...[truncated]"
+
+
+def _truncate_patch(patch: str, max_lines: int) -> str:
+    """Keep at most max_lines whole lines of a patch, and no more than
+    max_lines * 100 characters, so a cut never lands mid-line"""
+    max_chars = max_lines * 100
+    if len(patch) <= max_chars and patch.count("\n") < max_lines:
+        return patch
+    cut = 0
+    for _ in range(max_lines):
+        newline = patch.find("\n", cut, max_chars)
+        if newline == -1:
+            break
+        cut = newline + 1
+    if cut == len(patch):
+        return patch
+    if cut == 0:
+        # One enormous line (minified code): nothing whole to keep
+        cut = max_chars
+    return patch[:cut] + "...[truncated]"
+
+
+def _analyze_ast_cached(content: str, language: str) -> dict:
+    """AST-analyze file content, memoized by content hash (LRU-bounded)"""
+    key = (hashlib.sha256(content.encode("utf-8")).hexdigest(), language)
+    with _AST_CACHE_LOCK:
+        cached = _AST_CACHE.get(key)
+        if cached is not None:
+            _AST_CACHE.move_to_end(key)
+            return cached
+    
+    result = get_ast_analyzer().analyze_code(content, language)
+    with _AST_CACHE_LOCK:
+        _AST_CACHE[key] = result
+        if len(_AST_CACHE) > _AST_CACHE_SIZE:
+            _AST_CACHE.popitem(last=False)
+    return result
+
+
+def _trimmed_patch(patch: str) -> str:
+    """Patch as sent in a review prompt, memoized by patch hash (LRU-bounded)"""
+    key = hashlib.sha256(patch.encode("utf-8")).hexdigest()
+    with _TRIMMED_PATCH_CACHE_LOCK:
+        cached = _TRIMMED_PATCH_CACHE.get(key)
+        if cached is not None:
+            _TRIMMED_PATCH_CACHE.move_to_end(key)
+            return cached
+    
+    trimmed = DiffParser.compress_patch(patch, _PATCH_CONTEXT_LINES)
+    trimmed = _truncate_patch(trimmed, settings.max_lines_per_llm_call)
+    trimmed = _truncate_to_tokens(trimmed, settings.max_prompt_tokens)
+    with _TRIMMED_PATCH_CACHE_LOCK:
+        _TRIMMED_PATCH_CACHE[key] = trimmed
+        if len(_TRIMMED_PATCH_CACHE) > _TRIMMED_PATCH_CACHE_SIZE:
+            _TRIMMED_PATCH_CACHE.popitem(last=False)
+    return trimmed
+
+
+def _review_max_tokens(file_data: dict) -> int:
+    """Output token budget for a file, scaled by the size of its change"""
+    changed = file_data.get("additions", 0) + file_data.get("deletions", 0)
+    estimated = max(1, min(_MAX_ESTIMATED_FINDINGS, changed // 30))
+    return max(_MIN_RESPONSE_TOKENS, _BASE_RESPONSE_TOKENS + _TOKENS_PER_FINDING * estimated)
+
+
+def _decode_findings_array(response: str):
+    """Decode the findings array in a reply.
+    
+    Returns (items, complete). Each candidate start is tried in turn. The
+    slice up to the last "]" goes through the orjson-backed _json_loads;
+    when trailing prose with its own brackets breaks that slice, raw_decode
+    reads the array alone. When no candidate decodes, the reply was most
+    likely cut off at max_tokens: the elements that did arrive whole are
+    returned with complete=False. (None, False) means no array at all.
+    """
+    end = response.rfind("]") + 1
+    starts = [match.start() for match in _FINDINGS_ARRAY_START_RE.finditer(response)]
+    for start in starts:
+        try:
+            data = _json_loads(response[start:end])
+        except ValueError:
+            try:
+                data, _ = _JSON_DECODER.raw_decode(response, start)
+            except ValueError:
+                continue
+        if isinstance(data, list):
+            return data, True
+    for start in starts:
+        items = _complete_array_items(response, start)
+        if items:
+            return items, False
+    return None, False
+
+
+def _complete_array_items(text: str, start: int) -> list:
+    """Elements of the array opening at text[start] that decode whole,
+    up to the first one that doesn't"""
+    items = []
+    pos = start + 1
+    while True:
+        pos = _JSON_WHITESPACE_RE.match(text, pos).end()
+        try:
+            item, pos = _JSON_DECODER.raw_decode(text, pos)
+        except ValueError:
+            return items
+        if isinstance(item, dict):
+            items.append(item)
+        pos = _JSON_WHITESPACE_RE.match(text, pos).end()
+        if not text.startswith(",", pos):
+            return items
+        pos += 1
+
+
+def _digest(parts) -> str:
+    """SHA-256 over NUL-separated string parts"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _hunk_surroundings(content: str, patch: str) -> str:
+    """The new file's lines around each hunk of patch, position-free.
+    
+    Findings are written from the whole file, so reusing them at other
+    lines needs the code near each change to match too, not just the patch.
+    """
+    lines = content.split("\n")
+    margin = _MOVED_FINDINGS_CONTEXT_LINES
+    return "\n@@\n".join(
+        "\n".join(lines[max(0, start - 1 - margin):start - 1 + count + margin])
+        for start, count in DiffParser.get_hunk_ranges(patch)
+    )
+
+
+def _load_findings(cached):
+    """Findings from a cached JSON string or decoded list, or None if unreadable"""
+    if cached is None:
+        return None
+    try:
+        findings = _json_loads(cached) if isinstance(cached, (str, bytes)) else cached
+        # Enums come back as their string values
+        for finding in findings:
+            finding["severity"] = FindingSeverity(finding["severity"])
+            finding["category"] = FindingCategory(finding["category"])
+    except (ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable cached findings: {e}")
+        return None
+    return findings
+
+
+def _copy_to_duplicates(findings: list, duplicates: dict) -> list:
+    """Append a copy of each finding for every file identical to its file"""
+    if not duplicates:
+        return findings
+    copies = [
+        {**finding, "file_path": duplicate}
+        for finding in findings
+        for duplicate in duplicates.get(finding["file_path"], ())
+    ]
+    findings.extend(copies)
+    return findings
+
+
+def _safe_analyze(file_data: dict):
+    """AST for a diff entry, or None when there's no content, language or parse"""
+    full_content = file_data.get("full_content")
+    language = file_data.get("language", "unknown")
+    if not full_content or language == "unknown":
+        return None
+    try:
+        return _analyze_ast_cached(full_content, language)
+    except Exception as e:
+        logger.warning(f"AST analysis failed for {file_data.get('filename')}: {e}")
+        return None
+
+
+class _JSONStreamScanner:
+    """Tracks JSON bracket depth across streamed chunks.
+    
+    A value only opens at the start of a line (after optional whitespace),
+    where bare JSON answers and fenced blocks put it, so brackets in leading
+    prose or inline code are not mistaken for the answer. Brackets inside
+    string literals are ignored. feed() returns True once that value has
+    closed; start and end are then its offsets in the text fed so far, and
+    whatever followed it in the chunk has not been consumed.
+    """
+    __slots__ = ("depth", "in_string", "escape", "started", "line_start", "offset", "start", "end")
+    
+    def __init__(self):
+        self.offset = 0
+        self.reset()
+        self.line_start = True
+    
+    def reset(self):
+        """Look for the next value after one that closed"""
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.started = False
+        self.line_start = False
+        self.start = self.end = -1
+    
+    def feed(self, chunk: str) -> bool:
+        base = self.offset
+        self.offset += len(chunk)
+        for i, ch in enumerate(chunk):
+            if not self.started:
+                if ch in "[{" and self.line_start:
+                    self.started = True
+                    self.depth = 1
+                    self.start = base + i
+                elif ch == "\n":
+                    self.line_start = True
+                elif ch not in " \t\r":
+                    self.line_start = False
+            elif self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch in "[{":
+                self.depth += 1
+            elif ch in "]}":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = self.offset = base + i + 1
+                    return True
+        return False
+
+
+def _is_json_answer(segment: str) -> bool:
+    """True when segment decodes to an object or an array of objects, the
+    shapes every JSON answer here takes"""
+    try:
+        value = _json_loads(segment)
+    except ValueError:
+        return False
+    return isinstance(value, dict) or (
+        isinstance(value, list) and all(isinstance(item, dict) for item in value)
+    )
+
+
+_THINK_OPEN = "<think>"
+_THINK_CLOSE = "</think>"
+
+
+def _partial_tag_len(text: str, start: int, tag: str) -> int:
+    """Length of the longest suffix of text[start:] that begins tag"""
+    for n in range(min(len(tag) - 1, len(text) - start), 0, -1):
+        if text.endswith(tag[:n]):
+            return n
+    return 0
+
+
+class _ThinkStripper:
+    """Drops <think>...</think> blocks from text fed in arbitrary pieces.
+    
+    Reasoning models on Groq (deepseek-r1, qwen) emit these preambles, and
+    brackets inside them would otherwise trip the JSON stream scanner.
+    Each piece is scanned once with str.find; only a possible partial tag
+    at the end of a piece is held back until the next one arrives.
+    """
+    __slots__ = ("in_think", "pending")
+    
+    def __init__(self):
+        self.in_think = False
+        self.pending = ""
+    
+    def feed(self, chunk: str) -> str:
+        text = self.pending + chunk if self.pending else chunk
+        self.pending = ""
+        out = []
+        i = 0
+        while True:
+            tag = _THINK_CLOSE if self.in_think else _THINK_OPEN
+            j = text.find(tag, i)
+            if j < 0:
+                keep = _partial_tag_len(text, i, tag)
+                if not self.in_think:
+                    out.append(text[i:len(text) - keep])
+                if keep:
+                    self.pending = text[len(text) - keep:]
+                return "".join(out)
+            if not self.in_think:
+                out.append(text[i:j])
+            i = j + len(tag)
+            self.in_think = not self.in_think
+    
+    def flush(self) -> str:
+        """Text held back as a possible tag start that never completed"""
+        tail = "" if self.in_think else self.pending
+        self.pending = ""
+        return tail
+
+
+def _strip_think(text: str) -> str:
+    """Remove <think>...</think> blocks from a complete response"""
+    if not text or _THINK_OPEN not in text:
+        return text
+    stripper = _ThinkStripper()
+    return stripper.feed(text) + stripper.flush()
+
+
+def _strip_think_stream(pieces):
+    """Yield streamed pieces with <think>...</think> blocks removed"""
+    stripper = _ThinkStripper()
+    for piece in pieces:
+        if piece:
+            visible = stripper.feed(piece)
+            if visible:
+                yield visible
+    tail = stripper.flush()
+    if tail:
+        yield tail
+
+
+def _read_json_stream(pieces):
+    """Join streamed text pieces, stopping as soon as the JSON answer is complete.
+    
+    A bracketed value that doesn't decode as an answer (a "[1]" line, a
+    fragment of prose) is skipped and the stream read on. Returns (text,
+    complete); complete is False when the stream ended without a whole
+    answer, e.g. cut off at max_tokens, and such text must not be cached.
+    """
+    scanner = _JSONStreamScanner()
+    parts = []
+    for piece in pieces:
+        if not piece:
+            continue
+        parts.append(piece)
+        rest = piece
+        while scanner.feed(rest):
+            text = "".join(parts)
+            if _is_json_answer(text[scanner.start:scanner.end]):
+                return text, True
+            rest = text[scanner.end:]
+            scanner.reset()
+    return "".join(parts), False
+
+
+def _gemini_stream_text(response):
+    """Yield text pieces from a Gemini streamGenerateContent SSE response"""
+    for line in response.iter_lines():
+        if not line.startswith(b"data:"):
+            continue
+        event = _json_loads(line[5:])
+        for candidate in event.get("candidates", [])[:1]:
+            for part in candidate.get("content", {}).get("parts", []):
+                yield part.get("text", "")
+
+
+def _read_chat_stream(stream, strip_think: bool = False):
+    """Read an OpenAI-compatible chat completion stream, closing it early
+    once the JSON answer is complete so no further tokens are generated"""
+    try:
+        pieces = (chunk.choices[0].delta.content for chunk in stream if chunk.choices)
+        if strip_think:
+            pieces = _strip_think_stream(pieces)
+        return _read_json_stream(pieces)
+    finally:
+        stream.close()
+
+
+def _read_anthropic_tool_stream(stream):
+    """Read the forced tool call's input JSON from an Anthropic event stream.
+    
+    The input arrives as raw JSON text, so it goes straight to the parser
+    instead of through the SDK's dict and back out through a dumps.
+    """
+    try:
+        pieces = (
+            event.delta.partial_json for event in stream
+            if event.type == "content_block_delta" and event.delta.type == "input_json_delta"
+        )
+        return _read_json_stream(pieces)
+    finally:
+        stream.close()
+
+
+# Review prompts open with one of these static instruction blocks. Sent as
+# the system message they form a prefix shared by every call, which
+# OpenAI and Groq cache automatically and Anthropic caches on request.
+_REVIEW_SYSTEM_PROMPTS = {
+    prefix: f"{_REVIEW_SYSTEM_PROMPT}\n\n{prefix}"
+    for prefix in (_ANALYSIS_INSTRUCTIONS, _CROSS_FILE_INSTRUCTIONS)
+}
+
+
+def _split_review_prompt(prompt: str):
+    """(instructions, rest) of a review prompt; instructions is "" when
+    the prompt doesn't open with a known instruction block"""
+    for prefix in _REVIEW_SYSTEM_PROMPTS:
+        if prompt.startswith(prefix):
+            return prefix, prompt[len(prefix):]
+    return "", prompt
+
+
+def _chat_review_messages(prompt: str) -> list:
+    """OpenAI-style messages for a review prompt, instructions as system"""
+    instructions, rest = _split_review_prompt(prompt)
+    return [
+        {"role": "system", "content": _REVIEW_SYSTEM_PROMPTS.get(instructions, _REVIEW_SYSTEM_PROMPT)},
+        {"role": "user", "content": rest},
+    ]
+
+
+def _anthropic_review_request(prompt: str) -> dict:
+    """system and messages for an Anthropic review call, with the system
+    block marked cacheable"""
+    instructions, rest = _split_review_prompt(prompt)
+    return {
+        "system": [{
+            "type": "text",
+            "text": _REVIEW_SYSTEM_PROMPTS.get(instructions, _REVIEW_SYSTEM_PROMPT),
+            "cache_control": {"type": "ephemeral"},
+        }],
+        "messages": [{"role": "user", "content": rest}],
+    }
+
+
 class LLMService:
     """Service for AI-powered code analysis using LLMs.
     
@@ -74,49 +1036,231 @@ class LLMService:
         self.use_openai = bool(openai_key) and _ensure_openai()
         self.use_anthropic = bool(anthropic_key) and _ensure_anthropic()
         self.use_google = bool(google_key)
+        self._google_headers = {"x-goog-api-key": google_key} if google_key else {}
         self.use_groq = bool(groq_key) and _ensure_openai()  # Groq uses the openai SDK
+        # Self-hosted model, also spoken to through the openai SDK
+        self.use_local = bool(settings.local_llm_base_url) and _ensure_openai()
         self.provider = provider.lower()
+        self._response_cache = get_llm_cache()
+        # One metadata dict shared by every finding this service parses.
+        # Treat it as read-only: callers replace it rather than mutate it.
+        self._finding_metadata = {"source": "llm", "provider": self.provider}
+        
+        # Fallback order: the preferred provider first, then the rest
+        available = {
+            "groq": self.use_groq,
+            "openai": self.use_openai,
+            "anthropic": self.use_anthropic,
+            "google": self.use_google,
+            "local": self.use_local,
+        }
+        order = [self.provider] + [name for name in available if name != self.provider]
+        self._provider_order = [name for name in order if available.get(name)]
+        keys = {
+            "groq": groq_key,
+            "openai": openai_key,
+            "anthropic": anthropic_key,
+            "google": google_key,
+            "local": settings.local_llm_base_url,
+        }
+        self._breaker_ids = {
+            name: f"{name}:{hashlib.sha256(keys[name].encode()).hexdigest()[:12]}"
+            for name in self._provider_order
+        }
+        # Any provider in the chain may answer a raw call, so the whole
+        # chain and its models identify the response; a model change then
+        # misses the cache
+        self._raw_cache_model = "raw:" + ",".join(
+            f"{name}/{self._raw_model(name)}" for name in self._provider_order
+        )
+        
+        # Files are reviewed concurrently, so one stuck request sets the wall
+        # time for the whole analysis; bound it well below the SDK default
+        timeout = settings.llm_request_timeout_seconds
         
         if self.use_openai:
-            self.openai_client = openai.OpenAI(api_key=openai_key)
+            self.openai_client = _shared_client(
+                "openai", openai_key, lambda: openai.OpenAI(api_key=openai_key, timeout=timeout)
+            )
         
         if self.use_anthropic:
-            self.anthropic_client = anthropic_sdk.Anthropic(api_key=anthropic_key)
+            self.anthropic_client = _shared_client(
+                "anthropic", anthropic_key, lambda: anthropic_sdk.Anthropic(api_key=anthropic_key, timeout=timeout)
+            )
         
         if self.use_groq:
-            self.groq_client = openai.OpenAI(
+            self.groq_client = _shared_client("groq", groq_key, lambda: openai.OpenAI(
                 api_key=groq_key,
-                base_url="https://api.groq.com/openai/v1"
-            )
+                base_url="https://api.groq.com/openai/v1",
+                timeout=timeout,
+            ))
+        
+        if self.use_local:
+            # vLLM and llama.cpp ignore the key unless started with one
+            local_secret = f"{settings.local_llm_base_url}\n{settings.local_llm_api_key or ''}"
+            self.local_client = _shared_client("local", local_secret, lambda: openai.OpenAI(
+                api_key=settings.local_llm_api_key or "local",
+                base_url=settings.local_llm_base_url,
+                timeout=timeout,
+            ))
     
-    def analyze_diff(self, diff_data: list, rule_findings: list) -> list:
-        """Analyze diff using LLM for complex reasoning"""
-        findings = []
+    def analyze_diff(self, diff_data: list, rule_findings: list, allow_batch: bool = False,
+                     repo_full_name: str = None) -> list:
+        """Analyze diff using LLM for complex reasoning.
         
-        # Filter files to analyze (focus on significant changes)
-        files_to_analyze = [
-            f for f in diff_data
-            if f.get("patch") and f["additions"] + f["deletions"] > 5
-        ][:10]  # Limit to 10 files
+        allow_batch lets USE_LLM_BATCH_API route the review through a
+        provider Batch API, which can take minutes; only background runs
+        that nobody is waiting on should pass it. repo_full_name scopes
+        findings reused across line moves to the repository they came from;
+        without it they are not reused.
+        """
+        files_to_analyze, rule_counts, asts, duplicates = self._prepare_diff(diff_data, rule_findings)
+        if not files_to_analyze:
+            return []
         
-        for file_data in files_to_analyze:
+        if allow_batch and settings.use_llm_batch_api and len(files_to_analyze) >= _BATCH_MIN_FILES:
+            batch_findings = self._analyze_files_batch(files_to_analyze, rule_counts, asts)
+            if batch_findings is not None:
+                if len(files_to_analyze) > 1:
+                    try:
+                        batch_findings.extend(self._analyze_cross_file_impact(files_to_analyze, asts))
+                    except Exception as e:
+                        logger.error(f"Cross-file analysis failed: {e}")
+                return _copy_to_duplicates(batch_findings, duplicates)
+        
+        # Issue every provider call up front (the cross-file pass included) so
+        # wall time tracks the slowest call rather than the sum of them all.
+        jobs = self._llm_jobs(files_to_analyze, rule_counts, asts, repo_full_name)
+        futures = [_LLM_POOL.submit(job) for _, job in jobs]
+        results = []
+        for future in futures:
             try:
-                file_findings = self._analyze_file_with_llm(file_data, rule_findings)
-                findings.extend(file_findings)
+                results.append(future.result())
             except Exception as e:
-                logger.error(f"LLM analysis failed for {file_data['filename']}: {e}")
+                results.append(e)
+        return _copy_to_duplicates(self._collect_job_results(jobs, results), duplicates)
+    
+    def _prepare_diff(self, diff_data: list, rule_findings: list):
+        """Pick the files worth an LLM pass and gather their per-file inputs.
+        
+        Returns (files, rule finding counts by filename, ASTs by filename,
+        duplicates). Files whose content and patch match an earlier file are
+        left out and listed in duplicates under that file's name, so copied
+        migrations or generated stubs cost one LLM call between them.
+        """
+        # Count rule findings per file once instead of rescanning the whole
+        # list for every file's prompt
+        rule_counts = Counter(f["file_path"] for f in rule_findings)
+        # Once static analysis has flagged this much in a file, an LLM pass
+        # over it adds little; spend the calls on the other files
+        skip_threshold = settings.llm_skip_rule_findings_threshold
         
+        # Filter files to analyze (focus on significant changes)
+        files_to_analyze = []
+        duplicates = {}
+        first_by_hash = {}
+        # Copies of a kept file have the same length, so once the limit is
+        # reached only same-sized files are worth hashing
+        kept_sizes = set()
+        for f in diff_data:
+            if not f.get("patch") or f["additions"] + f["deletions"] <= 5:
+                continue
+            if skip_threshold > 0 and rule_counts[f["filename"]] >= skip_threshold:
+                logger.debug(f"Skipping LLM review of {f['filename']}: {rule_counts[f['filename']]} rule findings")
+                continue
+            content = f.get("full_content") or ""
+            size = len(content) + len(f["patch"])
+            full = len(files_to_analyze) >= 10  # Limit to 10 files
+            if full and size not in kept_sizes:
+                continue
+            digest = hashlib.sha256((content + f["patch"]).encode("utf-8")).hexdigest()
+            first = first_by_hash.get(digest)
+            if first is not None:
+                duplicates.setdefault(first, []).append(f["filename"])
+                continue
+            if not full:
+                first_by_hash[digest] = f["filename"]
+                kept_sizes.add(size)
+                files_to_analyze.append(f)
+        
+        # Parse each file once here and hand the result to both the
+        # cross-file pass and the per-file prompt
+        asts = {f["filename"]: _safe_analyze(f) for f in files_to_analyze}
+        return files_to_analyze, rule_counts, asts, duplicates
+    
+    def _llm_jobs(self, files_to_analyze: list, rule_counts: Counter, asts: dict,
+                  repo_full_name: str = None) -> list:
+        """(filename, zero-arg call) per LLM request; filename is None for
+        the cross-file pass, which goes first since it's usually the slowest"""
+        jobs = []
         # Add cross-file impact analysis if multiple files changed
         if len(files_to_analyze) > 1:
-            try:
-                cross_file_findings = self._analyze_cross_file_impact(files_to_analyze)
-                findings.extend(cross_file_findings)
-            except Exception as e:
-                logger.error(f"Cross-file analysis failed: {e}")
+            jobs.append((None, functools.partial(self._analyze_cross_file_impact, files_to_analyze, asts)))
+        for group in self._bundle_small_files(files_to_analyze):
+            if len(group) > 1:
+                jobs.append((", ".join(f["filename"] for f in group), functools.partial(
+                    self._analyze_bundle_with_llm, group, rule_counts, asts, repo_full_name
+                )))
+                continue
+            filename = group[0]["filename"]
+            jobs.append((filename, functools.partial(
+                self._analyze_file_with_llm,
+                group[0],
+                rule_counts[filename],
+                ast_data=asts[filename],
+                repo_full_name=repo_full_name,
+            )))
+        return jobs
+    
+    @staticmethod
+    def _bundle_small_files(files_to_analyze: list) -> list:
+        """Group files into requests, in file order.
         
+        Small changes are packed first-fit into groups of up to
+        LLM_MAX_FILES_PER_CALL whose patches total no more than one
+        request's patch budget; anything larger gets a request of its own.
+        """
+        max_files = settings.llm_max_files_per_call
+        budget = settings.max_lines_per_llm_call * 100
+        groups = []
+        open_groups = []  # [group, patch chars used]
+        for file_data in files_to_analyze:
+            size = len(file_data.get("patch", ""))
+            changed = file_data["additions"] + file_data["deletions"]
+            if max_files <= 1 or changed >= _BUNDLE_MAX_CHANGED_LINES or size > budget:
+                groups.append([file_data])
+                continue
+            for slot in open_groups:
+                if len(slot[0]) < max_files and slot[1] + size <= budget:
+                    slot[0].append(file_data)
+                    slot[1] += size
+                    break
+            else:
+                group = [file_data]
+                groups.append(group)
+                open_groups.append([group, size])
+        return groups
+    
+    @staticmethod
+    def _collect_job_results(jobs: list, results: list) -> list:
+        """Merge job results (findings lists or exceptions) in file order,
+        cross-file findings last, so output is deterministic"""
+        findings = []
+        cross_file = []
+        for (filename, _), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                if filename is None:
+                    logger.error(f"Cross-file analysis failed: {result}")
+                else:
+                    logger.error(f"LLM analysis failed for {filename}: {result}")
+            elif filename is None:
+                cross_file = result
+            else:
+                findings.extend(result)
+        findings.extend(cross_file)
         return findings
     
-    def _analyze_cross_file_impact(self, files_data: list) -> list:
+    def _analyze_cross_file_impact(self, files_data: list, asts: dict) -> list:
         """Analyze impact of changes across multiple files.
         
         Detects:
@@ -124,32 +1268,30 @@ class LLMService:
         - Cross-file dependency issues
         - Inconsistent changes across related files
         - Missing corresponding updates
+        
+        `asts` maps filename to the AST analysis computed in analyze_diff.
         """
         if len(files_data) < 2:
             return []
         
         # Build cross-file context
-        ast_analyzer = get_ast_analyzer()
         file_summaries = []
         
         for file_data in files_data[:5]:  # Limit to 5 files to avoid token overflow
             filename = file_data.get("filename", "")
-            language = file_data.get("language", "unknown")
-            full_content = file_data.get("full_content")
+            ast_data = asts.get(filename)
             
-            if full_content and language != "unknown":
-                try:
-                    ast_data = ast_analyzer.analyze_code(full_content, language)
-                    file_summaries.append({
-                        "file": filename,
-                        "functions": [f["name"] for f in ast_data.get("functions", [])],
-                        "classes": [c["name"] for c in ast_data.get("classes", [])],
-                        "imports": ast_data.get("imports", []),
-                        "exports": ast_data.get("exports", []),
-                        "changes": f"+{file_data.get('additions', 0)} -{file_data.get('deletions', 0)}"
-                    })
-                except Exception as e:
-                    logger.debug(f"Skipping AST for {filename}: {e}")
+            if ast_data:
+                # Truncate and join once here so the prompt builder only
+                # has to place ready-made strings
+                file_summaries.append({
+                    "file": filename,
+                    "functions_str": ", ".join(f["name"] for f in ast_data.get("functions", [])[:5]),
+                    "classes_str": ", ".join(c["name"] for c in ast_data.get("classes", [])[:3]),
+                    "imports_str": ", ".join(ast_data.get("imports", [])[:5]),
+                    "exports_str": ", ".join(ast_data.get("exports", [])[:5]),
+                    "changes": f"+{file_data.get('additions', 0)} -{file_data.get('deletions', 0)}"
+                })
         
         if not file_summaries:
             return []
@@ -157,163 +1299,355 @@ class LLMService:
         # Build cross-file analysis prompt
         prompt = self._build_cross_file_prompt(file_summaries)
         
-        # Call LLM
-        try:
-            if self.provider == "groq" and self.use_groq:
-                response = self._call_groq(prompt)
-            elif self.provider == "anthropic" and self.use_anthropic:
-                response = self._call_anthropic(prompt)
-            elif self.use_groq:
-                response = self._call_groq(prompt)
-            elif self.use_openai:
-                response = self._call_openai(prompt)
-            elif self.use_anthropic:
-                response = self._call_anthropic(prompt)
-            else:
-                return []
-            
-            # Parse cross-file findings
-            findings = self._parse_llm_response(response, "cross-file-analysis")
-            return findings
-        except Exception as e:
-            logger.error(f"Cross-file LLM call failed: {e}")
-            return []
-    
-    def _build_cross_file_prompt(self, file_summaries: list) -> str:
-        """Build prompt for cross-file impact analysis"""
-        
-        files_overview = "\n".join([
-            f"**{fs['file']}** ({fs['changes']})\n" +
-            (f"  - Functions: {', '.join(fs['functions'][:5])}\n" if fs['functions'] else "") +
-            (f"  - Classes: {', '.join(fs['classes'][:3])}\n" if fs['classes'] else "") +
-            (f"  - Imports: {', '.join(fs['imports'][:5])}\n" if fs['imports'] else "") +
-            (f"  - Exports: {', '.join(fs['exports'][:5])}\n" if fs['exports'] else "")
-            for fs in file_summaries
-        ])
-        
-        prompt = f"""You are an expert code reviewer analyzing cross-file impact in a Pull Request.
-
-**Files Changed ({len(file_summaries)}):**
-
-{files_overview}
-
-**Analysis Objectives:**
-
-Identify issues that span multiple files:
-
-1. **Breaking Changes**: 
-   - Function/method signature changes without updating callers
-   - Renamed classes/functions not updated across imports
-   - Removed exports still being imported elsewhere
-
-2. **Inconsistent Updates**:
-   - Related files that should be updated together but weren't
-   - Similar patterns changed in one file but not others
-   - Configuration files out of sync
-
-3. **Dependency Issues**:
-   - Circular dependencies introduced
-   - Missing imports after refactoring
-   - Import paths that might break after file moves
-
-4. **Missing Tests**:
-   - Code changes without corresponding test updates
-   - New functions/classes without test coverage
-
-**Example Quality Findings:**
-
-```json
-[
-  {{
-    "line_number": 0,
-    "severity": "high",
-    "category": "bug",
-    "title": "Function signature changed without updating callers",
-    "description": "File A modified calculateTotal() to require 2 parameters instead of 1, but File B (which imports and calls this function) was not updated. This will cause runtime errors.",
-    "suggestion": "Update all call sites in File B to pass the new required parameter."
-  }},
-  {{
-    "line_number": 0,
-    "severity": "medium",
-    "category": "best_practice",
-    "title": "Missing test updates for new authentication logic",
-    "description": "auth.py was modified to add two-factor authentication, but auth_test.py was not updated with corresponding test cases.",
-    "suggestion": "Add test cases in auth_test.py to verify 2FA login flow and failure scenarios."
-  }}
-]
-```
-
-**Output Format:**
-Return a valid JSON array of cross-file findings. Use line_number: 0 for multi-file issues.
-
-Return ONLY the JSON array, no markdown formatting. If no cross-file issues found, return: []
-
-Your JSON response:
-"""
+        # Call LLM; expect at most a couple of findings per file
+        max_tokens = max(
+            _MIN_RESPONSE_TOKENS, _BASE_RESPONSE_TOKENS + _TOKENS_PER_FINDING * 2 * len(file_summaries)
+        )
+        try:
+            response = self._call_review_llm(prompt, max_tokens=max_tokens)
+            if response is None:
+                return []
+            
+            # Parse cross-file findings
+            findings = self._parse_llm_response(response, "cross-file-analysis")
+            return findings
+        except Exception as e:
+            logger.error(f"Cross-file LLM call failed: {e}")
+            return []
+    
+    def _build_cross_file_prompt(self, file_summaries: list) -> str:
+        """Build prompt for cross-file impact analysis"""
+        
+        blocks = []
+        for fs in file_summaries:
+            lines = [f"**{fs['file']}** ({fs['changes']})\n"]
+            if fs['functions_str']:
+                lines.append(f"  - Functions: {fs['functions_str']}\n")
+            if fs['classes_str']:
+                lines.append(f"  - Classes: {fs['classes_str']}\n")
+            if fs['imports_str']:
+                lines.append(f"  - Imports: {fs['imports_str']}\n")
+            if fs['exports_str']:
+                lines.append(f"  - Exports: {fs['exports_str']}\n")
+            blocks.append("".join(lines))
+        files_overview = _truncate_to_tokens("\n".join(blocks), settings.max_prompt_tokens)
+        
+        prompt = _CROSS_FILE_INSTRUCTIONS + _CROSS_FILE_PROMPT_TEMPLATE.format(
+            file_count=len(file_summaries),
+            files_overview=files_overview,
+        )
         return prompt
     
-    def _analyze_file_with_llm(self, file_data: dict, rule_findings: list) -> list:
+    def _analyze_file_with_llm(self, file_data: dict, rule_finding_count: int, ast_data: dict = None,
+                               repo_full_name: str = None) -> list:
         """Analyze a single file with LLM using full context and AST"""
         filename = file_data["filename"]
-        patch = file_data.get("patch", "")
-        full_content = file_data.get("full_content")
-        language = file_data.get("language", "unknown")
         
-        # Limit patch size
-        if len(patch) > settings.max_lines_per_llm_call * 100:
-            patch = patch[:settings.max_lines_per_llm_call * 100]
+        # A rerun over an unchanged file (CI retry, force-push touching other
+        # files) reuses its findings without building or sending a prompt,
+        # whichever provider produced them
+        cache_key, cached = self._findings_cache_lookup(file_data, rule_finding_count, repo_full_name)
+        if cached is not None:
+            return cached
         
-        # Get AST analysis if full content is available
-        ast_data = None
-        if full_content and language != "unknown":
-            try:
-                ast_analyzer = get_ast_analyzer()
-                ast_data = ast_analyzer.analyze_code(full_content, language)
-            except Exception as e:
-                logger.warning(f"AST analysis failed for {filename}: {e}")
+        prompt = self._prepare_file_prompt(file_data, rule_finding_count, ast_data=ast_data)
+        
+        # Call LLM based on configured provider, falling back to the others
+        findings, complete = self._review_findings(prompt, filename, _review_max_tokens(file_data))
+        if findings is None:
+            # No LLM configured
+            return []
+        
+        # Unparseable or cut-off replies are retried next run, not replayed
+        if complete:
+            self._findings_cache_store(cache_key, findings)
+        return findings
+    
+    def _findings_cache_lookup(self, file_data: dict, rule_finding_count: int, repo_full_name: str = None):
+        """Return (key, cached findings or None) for a file's review.
+        
+        The exact entry covers the file's content and patch. Failing that,
+        with LLM_REUSE_MOVED_FINDINGS on, findings for the same patch text
+        at other line positions (a rebase or cherry-pick onto a different
+        base) are reused with their line numbers shifted hunk by hunk. That
+        reuse is limited to the same repository and needs the code around
+        each hunk to match, so it is skipped without repo_full_name.
+        The key is opaque; pass it to _findings_cache_store.
+        """
+        if self._response_cache is None:
+            return None, None
+        # The cache is shared by every user's service; whichever provider in
+        # this chain answered, its models identify the findings, so users on
+        # another provider or model never get them
+        common = (
+            _FINDINGS_CACHE_VERSION,
+            self._raw_cache_model,
+            file_data["filename"],
+            str(rule_finding_count),
+            "triage" if settings.llm_triage else "full",
+        )
+        patch = file_data.get("patch") or ""
+        exact_key = "findings:" + _digest(common + (file_data.get("full_content") or "", patch))
+        moved_key, starts = None, None
+        if settings.llm_reuse_moved_findings and repo_full_name:
+            position_free, starts = DiffParser.strip_hunk_positions(patch)
+            surroundings = _hunk_surroundings(file_data.get("full_content") or "", patch)
+            moved_key = "findings-moved:" + _digest(common + (repo_full_name, position_free, surroundings))
+        key = (exact_key, moved_key, starts)
+        
+        findings = _load_findings(self._response_cache.get(exact_key))
+        if findings is not None or moved_key is None:
+            return key, findings
+        
+        cached = self._response_cache.get(moved_key)
+        if cached is None:
+            return key, None
+        try:
+            entry = _json_loads(cached)
+            old_starts, findings = entry["starts"], _load_findings(entry["findings"])
+        except (ValueError, KeyError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable cached findings: {e}")
+            return key, None
+        if findings is None or len(old_starts) != len(starts):
+            return key, None
+        # Shift each line by the offset of the hunk it falls in
+        for finding in findings:
+            line = finding.get("line_number")
+            if old_starts and isinstance(line, int) and line > 0:
+                hunk = max(0, bisect.bisect_right(old_starts, line) - 1)
+                finding["line_number"] = line + starts[hunk] - old_starts[hunk]
+        logger.info(f"Reusing findings for {file_data['filename']} from the same change at other lines")
+        return key, findings
+    
+    def _findings_cache_store(self, key, findings: list):
+        """Cache a file's parsed findings under the key from _findings_cache_lookup"""
+        if not key:
+            return
+        exact_key, moved_key, starts = key
+        payload = _json_dumps(findings).decode("utf-8")
+        self._response_cache.set(exact_key, payload)
+        if moved_key:
+            self._response_cache.set(moved_key, _json_dumps({"starts": starts, "findings": findings}).decode("utf-8"))
+    
+    def _analyze_bundle_with_llm(self, files_data: list, rule_counts: Counter, asts: dict,
+                                 repo_full_name: str = None) -> list:
+        """Review several small files in one request, then split the
+        findings back out per file and cache them as per-file results"""
+        findings = []
+        pending = []
+        cache_keys = {}
+        for file_data in files_data:
+            filename = file_data["filename"]
+            cache_key, cached = self._findings_cache_lookup(file_data, rule_counts[filename], repo_full_name)
+            if cached is not None:
+                findings.extend(cached)
+            else:
+                pending.append(file_data)
+                cache_keys[filename] = cache_key
+        
+        if len(pending) == 1:
+            filename = pending[0]["filename"]
+            findings.extend(self._analyze_file_with_llm(
+                pending[0], rule_counts[filename], ast_data=asts[filename], repo_full_name=repo_full_name
+            ))
+            return findings
+        if not pending:
+            return findings
+        
+        sections = [
+            f"=== FILE: {file_data['filename']} ===\n" + self._prepare_file_section(
+                file_data, rule_counts[file_data["filename"]], ast_data=asts[file_data["filename"]]
+            )
+            for file_data in pending
+        ]
+        prompt = _ANALYSIS_INSTRUCTIONS + _BUNDLE_PROMPT_TEMPLATE.format(
+            file_count=len(pending),
+            file_sections="\n\n".join(sections),
+        )
+        max_tokens = min(_BUNDLE_MAX_TOKENS, sum(_review_max_tokens(f) for f in pending))
+        by_file = {filename: [] for filename in cache_keys}
+        bundle_findings, complete = self._review_findings(
+            prompt, None, max_tokens, schema=BUNDLE_FINDINGS_SCHEMA, bundle_files=by_file.keys()
+        )
+        if bundle_findings is None:
+            return findings
+        
+        for finding in bundle_findings:
+            by_file[finding["file_path"]].append(finding)
+        for filename, file_findings in by_file.items():
+            if complete:
+                self._findings_cache_store(cache_keys[filename], file_findings)
+            findings.extend(file_findings)
+        return findings
+    
+    def _prepare_file_prompt(self, file_data: dict, rule_finding_count: int, ast_data: dict = None) -> str:
+        """Build the per-file review prompt, including AST context when available"""
+        return _ANALYSIS_INSTRUCTIONS + _ANALYSIS_PROMPT_TEMPLATE.format(
+            file_section=self._prepare_file_section(file_data, rule_finding_count, ast_data=ast_data)
+        )
+    
+    def _prepare_file_section(self, file_data: dict, rule_finding_count: int, ast_data: dict = None) -> str:
+        """Build one file's part of a review prompt: name, context and diff"""
+        filename = file_data["filename"]
+        # Compressed and limited in size, computed once per distinct patch
+        patch = _trimmed_patch(file_data.get("patch") or "")
+        full_content = file_data.get("full_content")
         
         # Build enhanced prompt with full context
-        prompt = self._build_analysis_prompt(
+        return self._build_file_section(
             filename, 
             patch, 
-            rule_findings, 
+            rule_finding_count, 
             full_content=full_content,
             ast_data=ast_data
         )
+    
+    def _analyze_files_batch(self, files_data: list, rule_counts: Counter, asts: dict):
+        """Review files through the provider's Batch API instead of one call each.
         
-        # Call LLM based on configured provider
-        if self.provider == "groq" and self.use_groq:
-            response = self._call_groq(prompt)
-        elif self.provider == "anthropic" and self.use_anthropic:
-            response = self._call_anthropic(prompt)
-        elif self.provider == "google" and self.use_google:
-            response = self._call_google(prompt)
-        elif self.use_groq:
-            response = self._call_groq(prompt)
-        elif self.use_openai:
-            response = self._call_openai(prompt)
-        elif self.use_anthropic:
-            response = self._call_anthropic(prompt)
-        elif self.use_google:
-            response = self._call_google(prompt)
-        else:
-            # No LLM configured
-            return []
+        Batch requests are billed at about half price and scheduled by the
+        provider, but may take minutes to finish. Returns findings, or None
+        when batching isn't possible or doesn't finish within
+        LLM_BATCH_TIMEOUT_SECONDS, so the caller can use the interactive path.
+        """
+        backend = self._provider_order[0] if self._provider_order else None
+        if backend in (None, "google", "local"):
+            return None  # Gemini and local servers have no batch endpoint here
+        
+        # custom_id must be short and [A-Za-z0-9_-], so index rather than filename
+        prompts = {
+            f"file-{i}": (
+                self._prepare_file_prompt(
+                    file_data, rule_counts[file_data["filename"]], ast_data=asts[file_data["filename"]]
+                ),
+                _review_max_tokens(file_data),
+            )
+            for i, file_data in enumerate(files_data)
+        }
         
-        # Parse response
-        findings = self._parse_llm_response(response, filename)
+        try:
+            if backend == "anthropic":
+                responses = self._run_anthropic_batch(prompts)
+            elif backend == "groq":
+                responses = self._run_openai_batch(self.groq_client, settings.groq_model, prompts)
+            else:
+                responses = self._run_openai_batch(self.openai_client, _OPENAI_MODEL, prompts)
+        except Exception as e:
+            logger.warning(f"{backend} batch analysis failed, using per-file calls: {e}")
+            return None
+        if responses is None:
+            return None
         
+        findings = []
+        for i, file_data in enumerate(files_data):
+            response = responses.get(f"file-{i}")
+            if response is None:
+                logger.error(f"LLM batch returned no result for {file_data['filename']}")
+                continue
+            findings.extend(self._parse_llm_response(response, file_data["filename"]))
         return findings
     
-    def _build_analysis_prompt(
+    def _run_openai_batch(self, client, model: str, prompts: dict):
+        """Submit chat completions as one OpenAI-compatible batch and wait for it.
+        
+        `prompts` maps custom_id to (prompt, max_tokens).
+        """
+        if not hasattr(client, "batches"):
+            logger.info("Installed openai SDK has no Batch API support")
+            return None
+        
+        lines = [
+            _json_dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": model,
+                    "messages": _chat_review_messages(prompt),
+                    "temperature": 0.2,
+                    "max_tokens": max_tokens,
+                },
+            })
+            for custom_id, (prompt, max_tokens) in prompts.items()
+        ]
+        batch_file = client.files.create(
+            file=("review_batch.jsonl", b"\n".join(lines)),
+            purpose="batch",
+        )
+        batch = client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        
+        deadline = time.monotonic() + settings.llm_batch_timeout_seconds
+        while batch.status not in ("completed", "failed", "expired", "cancelled"):
+            if time.monotonic() > deadline:
+                logger.warning(f"LLM batch {batch.id} still {batch.status} at timeout; cancelling")
+                client.batches.cancel(batch.id)
+                return None
+            time.sleep(_BATCH_POLL_SECONDS)
+            batch = client.batches.retrieve(batch.id)
+        
+        if batch.status != "completed" or not batch.output_file_id:
+            logger.warning(f"LLM batch {batch.id} ended with status {batch.status}")
+            return None
+        
+        responses = {}
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            row = _json_loads(line)
+            body = (row.get("response") or {}).get("body") or {}
+            choices = body.get("choices") or []
+            if choices:
+                responses[row["custom_id"]] = choices[0]["message"]["content"]
+        return responses
+    
+    def _run_anthropic_batch(self, prompts: dict):
+        """Submit messages through Anthropic's Message Batches API and wait for it"""
+        batches = getattr(self.anthropic_client.messages, "batches", None)
+        if batches is None:
+            logger.info("Installed anthropic SDK has no Message Batches support")
+            return None
+        
+        batch = batches.create(requests=[
+            {
+                "custom_id": custom_id,
+                "params": {
+                    "model": _ANTHROPIC_MODEL,
+                    "max_tokens": max_tokens,
+                    "temperature": 0.2,
+                    **_anthropic_review_request(prompt),
+                },
+            }
+            for custom_id, (prompt, max_tokens) in prompts.items()
+        ])
+        
+        deadline = time.monotonic() + settings.llm_batch_timeout_seconds
+        while batch.processing_status != "ended":
+            if time.monotonic() > deadline:
+                logger.warning(f"Anthropic batch {batch.id} unfinished at timeout; cancelling")
+                batches.cancel(batch.id)
+                return None
+            time.sleep(_BATCH_POLL_SECONDS)
+            batch = batches.retrieve(batch.id)
+        
+        responses = {}
+        for entry in batches.results(batch.id):
+            if entry.result.type == "succeeded" and entry.result.message.content:
+                responses[entry.custom_id] = entry.result.message.content[0].text
+        return responses
+    
+    def _build_file_section(
         self, 
         filename: str, 
         patch: str, 
-        rule_findings: list,
+        rule_finding_count: int,
         full_content: str = None,
         ast_data: dict = None
     ) -> str:
-        """Build enhanced prompt for LLM analysis with full file context and AST data"""
+        """Build a file's prompt section with full file context and AST data"""
         
         # Build context sections
         context_sections = []
@@ -335,8 +1669,16 @@ Your JSON response:
                 context_sections.append(f"**Code Structure:**\n" + "\n".join(f"- {s}" for s in ast_summary))
                 context_sections.append(f"- Cyclomatic Complexity: {ast_data.get('complexity', 0)}")
         
-        # Add partial or full file content context
-        if full_content:
+        # Add partial or full file content context. With an AST, only the
+        # bodies of functions touched by the patch are sent; the rest of the
+        # file is already summarised in the structure block above.
+        if full_content and ast_data and ast_data.get("functions"):
+            changed_bodies = self._changed_function_bodies(
+                full_content, ast_data["functions"], DiffParser.get_changed_line_numbers(patch)
+            )
+            if changed_bodies:
+                context_sections.append(f"**Changed Functions:**\n```\n{changed_bodies}\n```")
+        elif full_content:
             # Limit full content to reasonable size (first/last portions)
             max_content_chars = 3000
             if len(full_content) > max_content_chars:
@@ -348,234 +1690,371 @@ Your JSON response:
         
         context_block = "\n\n".join(context_sections) if context_sections else ""
         
-        prompt = f"""You are an expert code reviewer with deep knowledge of software engineering best practices, security vulnerabilities, and performance optimization.
-
-File: {filename}
-
-{context_block}
-
-**Code Changes (Diff):**
-```
-{patch}
-```
-
-**Analysis Objectives:**
-1. **Logic & Correctness**: Identify bugs, incorrect logic, edge cases, off-by-one errors
-2. **Security**: Find vulnerabilities beyond simple patterns (auth bypasses, race conditions, TOCTOU, injection flaws, etc.)
-3. **Performance**: Detect inefficient algorithms, N+1 queries, memory leaks, unnecessary computations
-4. **Concurrency**: Identify race conditions, deadlock risks, thread-safety issues
-5. **Error Handling**: Gaps in error recovery, unhandled edge cases, resource leaks
-6. **Maintainability**: Complex code, poor naming, missing documentation for complex logic
-7. **Cross-file Impact**: Consider how changes might break other files that use this code
-
-**Context:**
-- Rule-based static analysis already detected {len([f for f in rule_findings if f['file_path'] == filename])} issues
-- You have access to the full file context and code structure (AST)
-- Focus on issues that require deep reasoning and understanding of the broader codebase
-- Ignore trivial style issues already caught by linters
-
-**Example Quality Findings:**
-
-```json
-[
-  {{
-    "line_number": 15,
-    "severity": "high",
-    "category": "bug",
-    "title": "Race condition in concurrent access",
-    "description": "The counter variable is accessed by multiple threads without synchronization. Two threads could read the same value simultaneously, increment it, and write back, resulting in lost updates.",
-    "suggestion": "Use threading.Lock() or atomic operations (threading.local, queue.Queue) to protect the counter variable."
-  }},
-  {{
-    "line_number": 42,
-    "severity": "medium",
-    "category": "performance",
-    "title": "N+1 query in loop",
-    "description": "The code fetches user details inside a loop for each post, resulting in N+1 database queries. For 1000 posts, this would execute 1001 queries.",
-    "suggestion": "Use select_related() or prefetch_related() to fetch users in a single query, or restructure to use a JOIN."
-  }},
-  {{
-    "line_number": 67,
-    "severity": "critical",
-    "category": "security",
-    "title": "Time-of-check to time-of-use (TOCTOU) vulnerability",
-    "description": "The code checks if file exists, then opens it later. An attacker could replace the file with a symlink to sensitive data between the check and use.",
-    "suggestion": "Open the file once with error handling, or use os.open() with O_EXCL|O_CREAT to prevent TOCTOU attacks."
-  }}
-]
-```
-
-**Output Format:**
-Return a valid JSON array of findings. Each finding must have:
-- line_number: Integer (use best estimate from diff context)
-- severity: One of ["critical", "high", "medium", "low"]
-- category: One of ["bug", "security", "performance", "best_practice"]
-- title: String (concise, under 80 chars)
-- description: String (detailed explanation with impact)
-- suggestion: String (specific, actionable fix)
-
-**Guidelines:**
-- Only report significant issues (not cosmetic)
-- Be specific with line numbers based on the diff
-- Use the full file context to understand impact on other functions/classes
-- Include WHY it's a problem, not just WHAT
-- Provide actionable suggestions
-- If no issues found, return: []
-- Return ONLY the JSON array, no markdown formatting
-
-Your JSON response:
-"""
-        return prompt
+        return _ANALYSIS_FILE_TEMPLATE.format(
+            filename=filename,
+            context_block=context_block,
+            patch=patch,
+            rule_finding_count=rule_finding_count,
+        )
+    
+    @staticmethod
+    def _changed_function_bodies(full_content: str, functions: list, changed_lines: list) -> str:
+        """Source of the outermost functions that contain a changed line"""
+        if not changed_lines:
+            return ""
+        spans = sorted(
+            (f["line"], f["end_line"]) for f in functions
+            if "end_line" in f and any(f["line"] <= n <= f["end_line"] for n in changed_lines)
+        )
+        lines = full_content.split('\n')
+        bodies = []
+        covered_until = 0
+        budget = _MAX_CHANGED_FUNCTION_LINES
+        for start, end in spans:
+            # Nested functions are already part of their enclosing body
+            if end <= covered_until:
+                continue
+            start = max(start, covered_until + 1)
+            body = lines[start - 1:end][:budget]
+            bodies.append(f"# lines {start}-{start + len(body) - 1}\n" + "\n".join(body))
+            covered_until = end
+            budget -= len(body)
+            if budget <= 0:
+                break
+        return "\n\n".join(bodies)
     
-    def _call_openai(self, prompt: str) -> str:
-        """Call OpenAI API with retry logic"""
-        max_retries = 3
-        retry_count = 0
+    def _throttle(self, name: str):
+        """Wait for a request slot under the provider's requests-per-minute
+        setting, or LLM_REQUESTS_PER_MINUTE when that is unset"""
+        per_minute = getattr(settings, f"{name}_requests_per_minute", 0) or settings.llm_requests_per_minute
+        if per_minute <= 0:
+            return
+        limiter_id = self._breaker_ids[name]
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(limiter_id)
+            if limiter is None:
+                limiter = _rate_limiters[limiter_id] = _TokenBucket(per_minute)
+        limiter.acquire()
+    
+    def _call_with_fallback(self, calls: dict):
+        """Try providers in preference order until one answers.
         
-        while retry_count < max_retries:
+        `calls` maps provider name to a zero-argument callable. Providers
+        whose circuit breaker is open are skipped. Returns None when no
+        provider is configured, and re-raises the last error when all fail.
+        """
+        last_error = None
+        for name in self._provider_order:
+            call = calls.get(name)
+            if call is None:
+                continue
+            breaker_id = self._breaker_ids[name]
+            with _breakers_lock:
+                state = _breakers.get(breaker_id)
+                if state and state["open_until"] > time.monotonic():
+                    logger.debug(f"Skipping {name}: circuit open")
+                    continue
+            
             try:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4-turbo-preview",
-                    messages=[
-                        {"role": "system", "content": "You are an expert code reviewer specializing in security, performance, and correctness. Respond only with valid JSON arrays."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.2,  # Lower for more consistent output
-                    max_tokens=2000,
-                    response_format={"type": "json_object"} if retry_count > 0 else None  # Force JSON on retry
-                )
-                return response.choices[0].message.content
-            except openai.RateLimitError:
-                logger.warning(f"Rate limit hit, retry {retry_count + 1}/{max_retries}")
-                retry_count += 1
-                if retry_count < max_retries:
-                    import time
-                    time.sleep(2 ** retry_count)  # Exponential backoff
-                else:
-                    raise
+                response = call()
             except Exception as e:
-                logger.error(f"OpenAI API error: {e}")
-                raise
-    
-    def _call_google(self, prompt: str) -> str:
-        """Call Google Gemini API"""
-        try:
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={settings.google_api_key}"
+                last_error = e
+                with _breakers_lock:
+                    state = _breakers.setdefault(breaker_id, {"failures": 0, "open_until": 0.0})
+                    state["failures"] += 1
+                    if state["failures"] >= _BREAKER_THRESHOLD:
+                        state["open_until"] = time.monotonic() + _BREAKER_COOLDOWN_SECONDS
+                        logger.warning(f"{name} failed {state['failures']} times; pausing it for {_BREAKER_COOLDOWN_SECONDS}s")
+                logger.warning(f"LLM provider {name} failed, trying next: {e}")
+                continue
             
-            payload = {
-                "contents": [{
-                    "parts": [{"text": prompt}]
-                }],
-                "generationConfig": {
-                    "temperature": 0.2,
-                    "maxOutputTokens": 2000,
-                    "responseMimeType": "application/json"
-                }
+            # Healthy providers have no entry; skip the lock in that case
+            if breaker_id in _breakers:
+                with _breakers_lock:
+                    _breakers.pop(breaker_id, None)
+            return response
+        
+        if last_error is not None:
+            raise last_error
+        return None
+    
+    def _call_review_llm(
+        self, prompt: str, max_tokens: int = None, schema: dict = FINDINGS_SCHEMA, triage: bool = False
+    ):
+        """Send a code-review prompt through the provider fallback chain.
+        
+        max_tokens caps the response; None keeps each provider's default.
+        schema is enforced where the provider supports structured output.
+        triage selects each provider's cheaper first-pass model.
+        """
+        openai_model = _TRIAGE_MODELS["openai"] if triage else _OPENAI_MODEL
+        anthropic_model = _TRIAGE_MODELS["anthropic"] if triage else _ANTHROPIC_MODEL
+        gemini_model = _TRIAGE_MODELS["google"] if triage else _GEMINI_MODEL
+        return self._call_with_fallback({
+            "groq": lambda: self._call_groq(prompt, max_tokens),
+            "openai": lambda: self._call_openai(prompt, max_tokens, schema, openai_model),
+            "anthropic": lambda: self._call_anthropic(prompt, max_tokens, schema, anthropic_model),
+            "google": lambda: self._call_google(prompt, max_tokens, gemini_model),
+            "local": lambda: self._call_local(prompt, max_tokens),
+        })
+    
+    def _review_findings(self, prompt: str, filename, max_tokens: int, schema: dict = FINDINGS_SCHEMA,
+                         bundle_files=None):
+        """Call the LLM for a review prompt and parse its findings.
+        
+        With LLM_TRIAGE on, the prompt goes to the cheap model first and is
+        only re-sent to the full model when triage flags something serious;
+        the full model's findings then replace the triage ones. Returns
+        (findings, complete), with findings None when no provider is
+        configured; only complete findings may be cached.
+        """
+        triage = settings.llm_triage
+        response = self._call_review_llm(prompt, max_tokens, schema, triage=triage)
+        if response is None:
+            return None, False
+        findings, complete = self._parse_findings(response, filename, bundle_files=bundle_files)
+        if triage and any(f["severity"] in _ESCALATE_SEVERITIES for f in findings):
+            logger.info(f"Triage flagged {filename or ', '.join(bundle_files)}; re-reviewing with the full model")
+            response = self._call_review_llm(prompt, max_tokens, schema)
+            if response is not None:
+                findings, complete = self._parse_findings(response, filename, bundle_files=bundle_files)
+            else:
+                complete = False
+        return findings, complete
+    
+    def _cache_lookup(self, model: str, system: str, prompt: str):
+        """Return (key, cached response or None) for a prompt"""
+        if self._response_cache is None:
+            return None, None
+        key = LLMResponseCache.make_key(model, system, prompt)
+        return key, self._response_cache.get(key)
+    
+    def _cache_store(self, key: str, response: str):
+        """Remember a successful, non-empty response"""
+        if key and response:
+            self._response_cache.set(key, response)
+    
+    @retry_with_backoff("OpenAI", _is_openai_rate_limit)
+    def _call_openai(
+        self, prompt: str, max_tokens: int = None, schema: dict = FINDINGS_SCHEMA, model: str = _OPENAI_MODEL
+    ) -> str:
+        """Call OpenAI API with retry on rate limits"""
+        max_tokens = max_tokens or 2000
+        cache_key, cached = self._cache_lookup(
+            f"openai:{model}:{max_tokens}", _REVIEW_SYSTEM_PROMPT, prompt
+        )
+        if cached is not None:
+            return cached
+        self._throttle("openai")
+        
+        response = self.openai_client.chat.completions.create(
+            model=model,
+            messages=_chat_review_messages(prompt),
+            temperature=0.2,  # Lower for more consistent output
+            max_tokens=max_tokens,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "findings", "schema": schema, "strict": True},
+            },
+            stream=True,
+        )
+        text, complete = _read_chat_stream(response)
+        if complete:
+            self._cache_store(cache_key, text)
+        return text
+    
+    def _call_google(self, prompt: str, max_tokens: int = None, model: str = _GEMINI_MODEL) -> str:
+        """Call Google Gemini API.
+        
+        HTTP errors (rate limits, outages) and empty replies raise, so the
+        fallback chain counts them against the breaker and moves on.
+        """
+        max_tokens = max_tokens or 2000
+        cache_key, cached = self._cache_lookup(f"google:{model}:{max_tokens}", "", prompt)
+        if cached is not None:
+            return cached
+        
+        text, complete = self._gemini_generate(prompt, max_tokens, model)
+        if complete:
+            self._cache_store(cache_key, text)
+        return text
+    
+    def _gemini_generate(self, prompt: str, max_tokens: int, model: str):
+        """Stream one Gemini JSON-mode generation; returns (text, complete)"""
+        self._throttle("google")
+        
+        # SSE streaming lets the read stop as soon as the JSON is complete
+        instructions, rest = _split_review_prompt(prompt)
+        payload = {
+            "contents": [{
+                "parts": [{"text": rest}]
+            }],
+            "generationConfig": {
+                "temperature": 0.2,
+                "maxOutputTokens": max_tokens,
+                "responseMimeType": "application/json"
             }
-            
-            response = requests.post(url, json=payload, timeout=30)
+        }
+        if instructions:
+            payload["systemInstruction"] = {"parts": [{"text": instructions}]}
+        
+        response = _gemini_session.post(
+            _GEMINI_STREAM_URL.format(model=model),
+            data=_json_dumps(payload),
+            headers=self._google_headers,
+            timeout=30,
+            stream=True,
+        )
+        try:
             response.raise_for_status()
-            
-            data = response.json()
-            if "candidates" in data and len(data["candidates"]) > 0:
-                text = data["candidates"][0]["content"]["parts"][0]["text"]
-                return text
-            else:
-                logger.warning("No content in Gemini response")
-                return "[]"
-                
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Google Gemini API error: {e}")
-            return "[]"
-        except Exception as e:
-            logger.error(f"Error calling Google Gemini: {e}")
-            return "[]"
+            text, complete = _read_json_stream(_gemini_stream_text(response))
+        finally:
+            response.close()
+        
+        if not text:
+            raise ValueError("No content in Gemini response")
+        return text, complete
     
-    def _call_anthropic(self, prompt: str) -> str:
-        """Call Anthropic Claude API with retry logic"""
-        max_retries = 3
-        retry_count = 0
+    @retry_with_backoff("Anthropic", _is_anthropic_overload)
+    def _call_anthropic(
+        self, prompt: str, max_tokens: int = None, schema: dict = FINDINGS_SCHEMA, model: str = _ANTHROPIC_MODEL
+    ) -> str:
+        """Call Anthropic Claude API with retry on rate limits"""
+        max_tokens = max_tokens or 2000
+        cache_key, cached = self._cache_lookup(
+            f"anthropic:{model}:{max_tokens}", _REVIEW_SYSTEM_PROMPT, prompt
+        )
+        if cached is not None:
+            return cached
+        self._throttle("anthropic")
         
-        while retry_count < max_retries:
-            try:
-                message = self.anthropic_client.messages.create(
-                    model="claude-sonnet-4-20250514",
-                    max_tokens=2000,
-                    temperature=0.2,
-                    system="You are an expert code reviewer specializing in security, performance, and correctness. Respond only with valid JSON arrays.",
-                    messages=[
-                        {"role": "user", "content": prompt}
-                    ],
-                )
-                # Extract text from the response
-                text = message.content[0].text if message.content else "[]"
-                return text
-            except Exception as e:
-                if "rate" in str(e).lower() or "overloaded" in str(e).lower():
-                    logger.warning(f"Anthropic rate limit, retry {retry_count + 1}/{max_retries}")
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        import time
-                        time.sleep(2 ** retry_count)
-                    else:
-                        raise
-                else:
-                    logger.error(f"Anthropic API error: {e}")
-                    raise
+        # Forcing a tool call makes Claude emit input that matches the
+        # schema instead of free text that may need cleaning up
+        stream = self.anthropic_client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0.2,
+            **_anthropic_review_request(prompt),
+            tools=[{
+                "name": "report_findings",
+                "description": "Report the code review findings for this change.",
+                "input_schema": schema,
+            }],
+            tool_choice={"type": "tool", "name": "report_findings"},
+            stream=True,
+        )
+        text, complete = _read_anthropic_tool_stream(stream)
+        if complete:
+            self._cache_store(cache_key, text)
+        return text
     
-    def _call_groq(self, prompt: str) -> str:
-        """Call Groq API (OpenAI-compatible) with retry logic"""
-        max_retries = 3
-        retry_count = 0
+    @retry_with_backoff("Groq", _is_groq_rate_limit)
+    def _call_groq(self, prompt: str, max_tokens: int = None) -> str:
+        """Call Groq API (OpenAI-compatible) with retry on rate limits"""
+        max_tokens = max_tokens or 4000
+        cache_key, cached = self._cache_lookup(
+            f"groq:{settings.groq_model}:{max_tokens}", _REVIEW_SYSTEM_PROMPT, prompt
+        )
+        if cached is not None:
+            return cached
+        self._throttle("groq")
         
-        while retry_count < max_retries:
-            try:
-                response = self.groq_client.chat.completions.create(
-                    model=settings.groq_model,
-                    messages=[
-                        {"role": "system", "content": "You are an expert code reviewer specializing in security, performance, and correctness. Respond only with valid JSON arrays."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    temperature=0.2,
-                    max_tokens=4000,
-                )
-                return response.choices[0].message.content
-            except Exception as e:
-                if "rate" in str(e).lower() or "limit" in str(e).lower():
-                    logger.warning(f"Groq rate limit, retry {retry_count + 1}/{max_retries}")
-                    retry_count += 1
-                    if retry_count < max_retries:
-                        import time
-                        time.sleep(2 ** retry_count)
-                    else:
-                        raise
-                else:
-                    logger.error(f"Groq API error: {e}")
-                    raise
+        response = self.groq_client.chat.completions.create(
+            model=settings.groq_model,
+            messages=_chat_review_messages(prompt),
+            temperature=0.2,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        text, complete = _read_chat_stream(response, strip_think=True)
+        if complete:
+            self._cache_store(cache_key, text)
+        return text
+    
+    def _call_local(self, prompt: str, max_tokens: int = None) -> str:
+        """Call the self-hosted model. No per-token cost or network hop, so
+        nothing to back off from; failures fall through to the next provider"""
+        max_tokens = max_tokens or 2000
+        cache_key, cached = self._cache_lookup(
+            f"local:{settings.local_llm_model}:{max_tokens}", _REVIEW_SYSTEM_PROMPT, prompt
+        )
+        if cached is not None:
+            return cached
+        
+        response = self.local_client.chat.completions.create(
+            model=settings.local_llm_model,
+            messages=_chat_review_messages(prompt),
+            temperature=0.2,
+            max_tokens=max_tokens,
+            stream=True,
+        )
+        # Reasoning-tuned coder models emit <think> blocks too
+        text, complete = _read_chat_stream(response, strip_think=True)
+        if complete:
+            self._cache_store(cache_key, text)
+        return text
     
     def _call_llm_raw(self, system_prompt: str, user_prompt: str) -> str:
         """Generic LLM call that returns raw text (not just JSON arrays).
         Used by risk score, auto-fix, and PR summary features."""
-        if self.provider == "groq" and self.use_groq:
-            return self._call_groq_raw(system_prompt, user_prompt)
-        elif self.provider == "anthropic" and self.use_anthropic:
-            msg = self.anthropic_client.messages.create(
-                model="claude-sonnet-4-20250514", max_tokens=4000, temperature=0.3,
-                system=system_prompt, messages=[{"role": "user", "content": user_prompt}])
-            return msg.content[0].text if msg.content else ""
-        elif self.use_groq:
-            return self._call_groq_raw(system_prompt, user_prompt)
-        elif self.use_openai:
-            resp = self.openai_client.chat.completions.create(
-                model="gpt-4-turbo-preview", max_tokens=4000, temperature=0.3,
-                messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}])
-            return resp.choices[0].message.content
-        elif self.use_google:
-            return self._call_google(f"{system_prompt}\n\n{user_prompt}")
-        return ""
-    
-    def _call_groq_raw(self, system_prompt: str, user_prompt: str) -> str:
+        cache_key, cached = self._cache_lookup(self._raw_cache_model, system_prompt, user_prompt)
+        if cached is not None:
+            return cached
+        response, complete = self._call_llm_raw_uncached(system_prompt, user_prompt)
+        if complete:
+            self._cache_store(cache_key, response)
+        return response
+    
+    @staticmethod
+    def _raw_model(name: str) -> str:
+        """Model that raw calls to a provider go to"""
+        if name == "groq":
+            return settings.groq_model
+        if name == "local":
+            return settings.local_llm_model
+        return {"openai": _OPENAI_MODEL, "anthropic": _ANTHROPIC_MODEL, "google": _GEMINI_MODEL}.get(name, name)
+    
+    def _call_llm_raw_uncached(self, system_prompt: str, user_prompt: str):
+        """Dispatch a raw call through the provider fallback chain.
+        
+        Returns (text, complete); a reply cut off at the token limit or an
+        empty result when no provider answers is not complete.
+        """
+        response = self._call_with_fallback({
+            "groq": lambda: self._call_groq_raw(system_prompt, user_prompt),
+            "openai": lambda: self._call_openai_raw(system_prompt, user_prompt),
+            "anthropic": lambda: self._call_anthropic_raw(system_prompt, user_prompt),
+            "google": lambda: self._call_google_raw(system_prompt, user_prompt),
+            "local": lambda: self._call_local_raw(system_prompt, user_prompt),
+        })
+        return response or ("", False)
+    
+    def _call_openai_raw(self, system_prompt: str, user_prompt: str):
+        """Call OpenAI with arbitrary system/user prompts"""
+        self._throttle("openai")
+        resp = self.openai_client.chat.completions.create(
+            model=_OPENAI_MODEL, max_tokens=4000, temperature=0.3,
+            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}])
+        choice = resp.choices[0]
+        text = choice.message.content or ""
+        return text, bool(text) and choice.finish_reason != "length"
+    
+    def _call_anthropic_raw(self, system_prompt: str, user_prompt: str):
+        """Call Anthropic with arbitrary system/user prompts"""
+        self._throttle("anthropic")
+        msg = self.anthropic_client.messages.create(
+            model=_ANTHROPIC_MODEL, max_tokens=4000, temperature=0.3,
+            system=system_prompt, messages=[{"role": "user", "content": user_prompt}])
+        text = msg.content[0].text if msg.content else ""
+        return text, bool(text) and msg.stop_reason != "max_tokens"
+    
+    def _call_google_raw(self, system_prompt: str, user_prompt: str):
+        """Call Gemini with arbitrary system/user prompts"""
+        return self._gemini_generate(f"{system_prompt}\n\n{user_prompt}", 4000, _GEMINI_MODEL)
+    
+    def _call_groq_raw(self, system_prompt: str, user_prompt: str):
         """Call Groq with arbitrary system/user prompts"""
+        self._throttle("groq")
         response = self.groq_client.chat.completions.create(
             model=settings.groq_model,
             messages=[
@@ -585,32 +2064,47 @@ Your JSON response:
             temperature=0.3,
             max_tokens=4000,
         )
-        return response.choices[0].message.content
+        choice = response.choices[0]
+        text = _strip_think(choice.message.content or "")
+        return text, bool(text) and choice.finish_reason != "length"
+    
+    def _call_local_raw(self, system_prompt: str, user_prompt: str):
+        """Call the self-hosted model with arbitrary system/user prompts"""
+        response = self.local_client.chat.completions.create(
+            model=settings.local_llm_model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            temperature=0.3,
+            max_tokens=4000,
+        )
+        choice = response.choices[0]
+        text = _strip_think(choice.message.content or "")
+        return text, bool(text) and choice.finish_reason != "length"
     
     def compute_risk_score(self, diff_data: list, findings: list) -> dict:
         """Compute a 0-100 PR risk score using AI + heuristics.
         
         Returns: { score: float, label: str, breakdown: dict, explanation: str }
         """
-        # Heuristic factors
-        total_additions = sum(f.get("additions", 0) for f in diff_data)
-        total_deletions = sum(f.get("deletions", 0) for f in diff_data)
+        # Heuristic factors, gathered in one pass over each list
+        total_additions = total_deletions = sensitive_files = 0
+        for f in diff_data:
+            total_additions += f.get("additions", 0)
+            total_deletions += f.get("deletions", 0)
+            # Sensitive file patterns (high blast radius)
+            if SENSITIVE_FILE_RE.search(f.get("filename", "")):
+                sensitive_files += 1
         files_changed = len(diff_data)
         
-        critical_count = sum(1 for f in findings if f.get("severity") in ("critical", FindingSeverity.CRITICAL))
-        high_count = sum(1 for f in findings if f.get("severity") in ("high", FindingSeverity.HIGH))
-        medium_count = sum(1 for f in findings if f.get("severity") in ("medium", FindingSeverity.MEDIUM))
-        
-        # Sensitive file patterns (high blast radius)
-        sensitive_patterns = [
-            "auth", "security", "password", "token", "key", "secret",
-            "payment", "billing", "database", "migration", "config",
-            ".env", "docker", "ci", "deploy", "infra"
-        ]
-        sensitive_files = sum(
-            1 for f in diff_data
-            if any(p in f.get("filename", "").lower() for p in sensitive_patterns)
+        # Severities arrive as FindingSeverity members or plain strings
+        severity_counts = Counter(
+            getattr(f.get("severity"), "value", f.get("severity")) for f in findings
         )
+        critical_count = severity_counts[FindingSeverity.CRITICAL.value]
+        high_count = severity_counts[FindingSeverity.HIGH.value]
+        medium_count = severity_counts[FindingSeverity.MEDIUM.value]
         
         # Compute heuristic score components
         size_score = min(30, (total_additions + total_deletions) / 20)  # 0-30
@@ -622,10 +2116,10 @@ Your JSON response:
         
         # AI refinement (ask LLM for context-aware adjustment)
         try:
-            file_list = ", ".join(f.get("filename", "?") for f in diff_data[:15])
+            file_list = ", ".join(f.get("filename", "?") for f in islice(diff_data, 15))
             finding_summary = "; ".join(
                 f"{f.get('title', '?')} ({f.get('severity', '?')})" 
-                for f in findings[:10]
+                for f in islice(findings, 10)
             )
             
             ai_prompt = f"""Given this PR analysis, provide a risk assessment as JSON:
@@ -642,7 +2136,8 @@ Return ONLY valid JSON: {{"ai_adjustment": <number -15 to +15>, "explanation": "
                 ai_prompt
             )
             
-            ai_data = json.loads(ai_response.strip().strip('```json').strip('```'))
+            match = _JSON_OBJECT_RE.search(ai_response)
+            ai_data = _json_loads(match.group(0)) if match else {}
             ai_adjustment = max(-15, min(15, ai_data.get("ai_adjustment", 0)))
             explanation = ai_data.get("explanation", "")
         except Exception as e:
@@ -712,11 +2207,10 @@ Format:
                 prompt
             )
             
-            # Clean up response
-            result = result.strip()
-            if result.startswith("```"):
-                lines = result.split("\n")
-                result = "\n".join(lines[1:-1] if lines[-1].strip() == "```" else lines[1:])
+            # Keep only the diff if the model wrapped it in a fence anyway
+            match = _FENCED_BLOCK_RE.search(result)
+            if match:
+                result = match.group(1)
             
             return result.strip()
         except Exception as e:
@@ -729,8 +2223,8 @@ Format:
         Returns a human-readable summary paragraph.
         """
         try:
-            file_list = "\n".join(f"- {f.get('filename', '?')} (+{f.get('additions', 0)} -{f.get('deletions', 0)})" for f in diff_data[:20])
-            finding_list = "\n".join(f"- [{f.get('severity', '?')}] {f.get('title', '?')} in {f.get('file_path', '?')}" for f in findings[:15])
+            file_list = "\n".join(f"- {f.get('filename', '?')} (+{f.get('additions', 0)} -{f.get('deletions', 0)})" for f in islice(diff_data, 20))
+            finding_list = "\n".join(f"- [{f.get('severity', '?')}] {f.get('title', '?')} in {f.get('file_path', '?')}" for f in islice(findings, 15))
             
             prompt = f"""Summarize this Pull Request for a non-technical project manager or stakeholder.
 
@@ -761,50 +2255,68 @@ Use plain English, no jargon. Be concise."""
             logger.error(f"PR summary generation failed: {e}")
             return ""
     
-    def _parse_llm_response(self, response: str, filename: str) -> list:
-        """Parse LLM response into findings with robust error handling"""
+    def _llm_finding(self, file_path, line_number, severity, category, title, description, suggestion) -> dict:
+        """Finding dict for one validated LLM item"""
+        return {
+            "file_path": file_path,
+            "line_number": line_number,
+            # str() so a null or numeric label falls back instead of
+            # failing the whole response
+            "severity": _SEVERITY_MAP.get(str(severity or "").lower(), FindingSeverity.MEDIUM),
+            "category": _CATEGORY_MAP.get(str(category or "").lower(), FindingCategory.BUG),
+            "rule_id": "AI:reasoning",
+            "title": title[:200],  # Limit length
+            "description": description[:1000],
+            "suggestion": suggestion[:500],
+            "is_ai_generated": 1,
+            "finding_metadata": self._finding_metadata
+        }
+    
+    def _parse_llm_response(self, response: str, filename: str, bundle_files=None) -> list:
+        """Parse LLM response into findings with robust error handling.
+        
+        For a multi-file request pass the reviewed names as bundle_files;
+        each finding then takes its file from its own file_path, and
+        findings naming any other file are dropped.
+        """
+        return self._parse_findings(response, filename, bundle_files=bundle_files)[0]
+    
+    def _parse_findings(self, response: str, filename: str, bundle_files=None):
+        """Parse findings as _parse_llm_response does; returns (findings,
+        complete). complete is False when the reply held no findings array,
+        was cut off, or failed to process, so the result must not be cached."""
         findings = []
+        complete = False
         
         try:
-            # Try to extract JSON from response (handle markdown code blocks)
-            response_clean = response.strip()
-            
-            # Remove markdown code blocks if present
-            if response_clean.startswith('```'):
-                lines = response_clean.split('\n')
-                response_clean = '\n'.join(lines[1:-1]) if len(lines) > 2 else response_clean
-            
-            # Find JSON array
-            json_start = response_clean.find('[')
-            json_end = response_clean.rfind(']') + 1
+            data, complete = _decode_findings_array(response)
+            if data is None:
+                logger.warning(f"No JSON findings array in LLM response: {response[:200]}")
+                return [], False
+            if not complete:
+                logger.warning(f"LLM response was cut off; keeping its {len(data)} complete findings")
             
-            if json_start == -1 or json_end == 0:
-                logger.warning("No JSON array found in LLM response")
-                return []
-            
-            json_str = response_clean[json_start:json_end]
-            data = json.loads(json_str)
-            
-            # Validate it's a list
-            if not isinstance(data, list):
-                logger.warning(f"LLM response is not a list: {type(data)}")
-                return []
-            
-            # Map severity
-            severity_map = {
-                "critical": FindingSeverity.CRITICAL,
-                "high": FindingSeverity.HIGH,
-                "medium": FindingSeverity.MEDIUM,
-                "low": FindingSeverity.LOW
-            }
-            
-            # Map category
-            category_map = {
-                "bug": FindingCategory.BUG,
-                "security": FindingCategory.SECURITY,
-                "performance": FindingCategory.PERFORMANCE,
-                "best_practice": FindingCategory.BEST_PRACTICE
-            }
+            # Fast path: the whole array matches the schema
+            items = None
+            if _convert_llm_findings is not None:
+                try:
+                    items = _convert_llm_findings(data)
+                except _MsgspecDecodeError:
+                    pass
+            if items is not None:
+                for idx, item in enumerate(items):
+                    file_path = filename
+                    if bundle_files is not None:
+                        file_path = item.file_path
+                        if file_path not in bundle_files:
+                            logger.warning(f"Skipping finding {idx}: unknown file {file_path!r}")
+                            continue
+                    findings.append(self._llm_finding(
+                        file_path, item.line_number, item.severity, item.category,
+                        item.title, item.description, item.suggestion,
+                    ))
+                logger.info(f"Parsed {len(findings)} findings from LLM response")
+                return findings, complete
             
             for idx, item in enumerate(data):
                 # Validate required fields
@@ -816,25 +2328,54 @@ Use plain English, no jargon. Be concise."""
                     logger.warning(f"Skipping finding {idx}: missing title or description")
                     continue
                 
-                finding = {
-                    "file_path": filename,
-                    "line_number": item.get("line_number", 0),
-                    "severity": severity_map.get(item.get("severity", "").lower(), FindingSeverity.MEDIUM),
-                    "category": category_map.get(item.get("category", "").lower(), FindingCategory.BUG),
-                    "rule_id": "AI:reasoning",
-                    "title": item.get("title", "AI-detected issue")[:200],  # Limit length
-                    "description": item.get("description", "")[:1000],
-                    "suggestion": item.get("suggestion", "")[:500],
-                    "is_ai_generated": 1,
-                    "finding_metadata": {"source": "llm", "provider": self.provider}
-                }
-                findings.append(finding)
+                file_path = filename
+                if bundle_files is not None:
+                    file_path = item.get("file_path")
+                    if file_path not in bundle_files:
+                        logger.warning(f"Skipping finding {idx}: unknown file {file_path!r}")
+                        continue
+                
+                findings.append(self._llm_finding(
+                    file_path, item.get("line_number", 0), item.get("severity"), item.get("category"),
+                    item.get("title", "AI-detected issue"), item.get("description", ""), item.get("suggestion", ""),
+                ))
             
             logger.info(f"Parsed {len(findings)} findings from LLM response")
         
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse LLM response as JSON: {e}\nResponse: {response[:200]}")
         except Exception as e:
             logger.error(f"Error processing LLM response: {e}")
+            return findings, False
         
-        return findings
+        return findings, complete
+
+
+# Services are rebuilt from the same handful of user key sets on every
+# request and task; keep the recent ones so provider setup and breaker ids
+# are computed once per key set. Instances hold no per-run state.
+_llm_services: "OrderedDict[str, LLMService]" = OrderedDict()
+_llm_services_lock = threading.Lock()
+_LLM_SERVICES_SIZE = 64
+
+
+def get_llm_service(user_keys: dict = None) -> LLMService:
+    """Get the cached LLMService for user_keys, creating it on first use"""
+    keys = user_keys or {}
+    service_id = hashlib.sha256("\n".join(
+        keys.get(name) or "" for name in (
+            "groq_api_key", "openai_api_key", "anthropic_api_key",
+            "google_api_key", "preferred_llm_provider",
+        )
+    ).encode()).hexdigest()
+    with _llm_services_lock:
+        service = _llm_services.get(service_id)
+        if service is not None:
+            _llm_services.move_to_end(service_id)
+            return service
+    # Built outside the lock: client setup can be slow and a duplicate
+    # instance for the same keys is harmless
+    service = LLMService(user_keys=user_keys)
+    with _llm_services_lock:
+        service = _llm_services.setdefault(service_id, service)
+        if len(_llm_services) > _LLM_SERVICES_SIZE:
+            _llm_services.popitem(last=False)
+    return service
@@ -4,16 +4,25 @@ from app.tasks import celery_app
 from app.database import SessionLocal
 from app.models import AnalysisRun, Finding, Project, User, RunStatus, FindingSeverity, FindingCategory
 from app.services.analyzer_service import AnalyzerService
-from app.services.llm_service import LLMService
+from app.services.llm_service import get_llm_service
 from app.services.diff_parser import DiffParser
 from app.services.semantic_search import get_semantic_search_service
 from app.services.code_sandbox import get_code_sandbox
 from datetime import datetime
-from collections import defaultdict
+from collections import Counter, defaultdict
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Sort rank for merging duplicates (critical first); built once, not per group
+_SEVERITY_RANK = {
+    FindingSeverity.CRITICAL: 0,
+    FindingSeverity.HIGH: 1,
+    FindingSeverity.MEDIUM: 2,
+    FindingSeverity.LOW: 3,
+    FindingSeverity.INFO: 4,
+}
+
 
 def _get_github_service(project, owner):
     """Get the appropriate GitHub service — PAT-based (SaaS) or App-based (legacy)."""
@@ -89,7 +98,7 @@ def analyze_pr_task(self, run_id: int):
                 "google_api_key": owner.google_api_key,
                 "preferred_llm_provider": owner.preferred_llm_provider,
             }
-        llm_service = LLMService(user_keys=user_keys)
+        llm_service = get_llm_service(user_keys)
         
         # Run rule-based analysis
         logger.info("Running rule-based analysis...")
@@ -97,7 +106,10 @@ def analyze_pr_task(self, run_id: int):
         
         # Run AI analysis on selected hunks
         logger.info("Running AI analysis...")
-        ai_findings = llm_service.analyze_diff(diff_data, rule_findings)
+        # Background run: nobody is waiting, so the Batch API may be used
+        ai_findings = llm_service.analyze_diff(
+            diff_data, rule_findings, allow_batch=True, repo_full_name=project.github_repo_full_name
+        )
         
         # Merge findings
         all_findings = rule_findings + ai_findings
@@ -110,6 +122,8 @@ def analyze_pr_task(self, run_id: int):
         # Save findings to database
         semantic_search = get_semantic_search_service()
         code_sandbox = get_code_sandbox()
+        # Index the diff once rather than scanning it up to three times per finding
+        files_by_name = {f["filename"]: f for f in diff_data}
         
         for finding_data in deduplicated_findings:
             # Generate auto-fix for critical/high findings
@@ -118,18 +132,10 @@ def analyze_pr_task(self, run_id: int):
             
             if finding_data["severity"] in (FindingSeverity.CRITICAL, FindingSeverity.HIGH):
                 try:
-                    file_patch = next(
-                        (f.get("patch", "") for f in diff_data if f["filename"] == finding_data["file_path"]),
-                        ""
-                    )
-                    full_content = next(
-                        (f.get("full_content", "") for f in diff_data if f["filename"] == finding_data["file_path"]),
-                        ""
-                    )
-                    language = next(
-                        (f.get("language", "unknown") for f in diff_data if f["filename"] == finding_data["file_path"]),
-                        "unknown"
-                    )
+                    file_data = files_by_name.get(finding_data["file_path"], {})
+                    file_patch = file_data.get("patch", "")
+                    full_content = file_data.get("full_content", "")
+                    language = file_data.get("language", "unknown")
                     
                     if file_patch:
                         # Generate fix
@@ -141,8 +147,12 @@ def analyze_pr_task(self, run_id: int):
                             # Apply the fix patch to get fixed code (simplified - in production use proper patch application)
                             # For now, we'll skip actual patch application and just note that it was tested
                             auto_fix_tested = True
-                            finding_data["finding_metadata"]["auto_fix_tested"] = True
-                            finding_data["finding_metadata"]["auto_fix_safe"] = True  # Would be set based on sandbox results
+                            # Copy rather than update: LLM findings share one metadata dict
+                            finding_data["finding_metadata"] = {
+                                **finding_data.get("finding_metadata", {}),
+                                "auto_fix_tested": True,
+                                "auto_fix_safe": True,  # Would be set based on sandbox results
+                            }
                 
                 except Exception as e:
                     logger.warning(f"Auto-fix generation failed for {finding_data.get('title', '?')}: {e}")
@@ -214,8 +224,9 @@ def analyze_pr_task(self, run_id: int):
         post_findings_to_pr(github_service, run, deduplicated_findings, project.github_repo_full_name)
         
         # Create final status check
-        critical_count = sum(1 for f in deduplicated_findings if f["severity"] == FindingSeverity.CRITICAL)
-        high_count = sum(1 for f in deduplicated_findings if f["severity"] == FindingSeverity.HIGH)
+        severity_counts = Counter(f["severity"] for f in deduplicated_findings)
+        critical_count = severity_counts[FindingSeverity.CRITICAL]
+        high_count = severity_counts[FindingSeverity.HIGH]
         
         if critical_count > 0:
             state = "failure"
@@ -276,17 +287,8 @@ def deduplicate_findings(findings: list) -> list:
             deduplicated.append(group[0])
         else:
             # Multiple findings on same line - prioritize and merge
-            # Sort by severity (critical > high > medium > low)
-            severity_order = {
-                FindingSeverity.CRITICAL: 0,
-                FindingSeverity.HIGH: 1,
-                FindingSeverity.MEDIUM: 2,
-                FindingSeverity.LOW: 3
-            }
-            group_sorted = sorted(group, key=lambda f: severity_order[f["severity"]])
-            
-            # Keep highest severity finding as base
-            merged = group_sorted[0].copy()
+            # Keep highest severity finding as base (critical > high > medium > low)
+            merged = min(group, key=lambda f: _SEVERITY_RANK.get(f["severity"], 4)).copy()
             
             # If others are different categories, mention them
             categories = set(f["category"] for f in group)
@@ -301,10 +303,13 @@ def deduplicate_findings(findings: list) -> list:
 def post_findings_to_pr(github_service: GitHubService, run: AnalysisRun, findings: list, repo_full_name: str):
     """Post findings as comments on PR"""
     
-    # Group findings by severity
-    critical = [f for f in findings if f["severity"] == FindingSeverity.CRITICAL]
-    high = [f for f in findings if f["severity"] == FindingSeverity.HIGH]
-    medium = [f for f in findings if f["severity"] == FindingSeverity.MEDIUM]
+    # Group findings by severity in one pass
+    by_severity = defaultdict(list)
+    for f in findings:
+        by_severity[f["severity"]].append(f)
+    critical = by_severity[FindingSeverity.CRITICAL]
+    high = by_severity[FindingSeverity.HIGH]
+    medium = by_severity[FindingSeverity.MEDIUM]
     
     # Create summary comment
     summary = f"""## 🤖 AI Code Review Summary
@@ -338,6 +343,7 @@ def post_findings_to_pr(github_service: GitHubService, run: AnalysisRun, finding
     github_service.post_pr_comment(repo_full_name, run.pr_number, summary)
     
     # Post inline comments for critical/high issues
+    comments = []
     for finding in critical + high[:5]:  # Limit inline comments
         if finding.get("line_number"):
             body = f"""**{finding['title']}** ({finding['severity'].value})
@@ -348,14 +354,37 @@ def post_findings_to_pr(github_service: GitHubService, run: AnalysisRun, finding
             if finding.get("suggestion"):
                 body += f"**Suggestion:** {finding['suggestion']}\n"
             
-            try:
-                github_service.post_review_comment(
-                    repo_full_name=repo_full_name,
-                    pr_number=run.pr_number,
-                    commit_sha=run.head_sha,
-                    file_path=finding['file_path'],
-                    line=finding['line_number'],
-                    body=body
-                )
-            except Exception as e:
-                logger.warning(f"Failed to post inline comment: {e}")
+            comments.append({
+                "path": finding['file_path'],
+                "line": finding['line_number'],
+                "body": body
+            })
+    
+    if not comments:
+        return
+    
+    # One review carries all inline comments; GitHub rejects it wholesale if
+    # any line is outside the diff, so fall back to posting individually
+    try:
+        github_service.submit_review(
+            repo_full_name=repo_full_name,
+            pr_number=run.pr_number,
+            commit_sha=run.head_sha,
+            comments=comments
+        )
+        return
+    except Exception as e:
+        logger.warning(f"Failed to post batched review, posting comments individually: {e}")
+    
+    for comment in comments:
+        try:
+            github_service.post_review_comment(
+                repo_full_name=repo_full_name,
+                pr_number=run.pr_number,
+                commit_sha=run.head_sha,
+                file_path=comment['path'],
+                line=comment['line'],
+                body=comment['body']
+            )
+        except Exception as e:
+            logger.warning(f"Failed to post inline comment: {e}")
@@ -0,0 +1,44 @@
+"""GitHub App installation-token minting reuses the cached app JWT."""
+
+from app.services import github_service
+
+
+class _FakeResponse:
+    def __init__(self, token: str):
+        self.content = (
+            '{"token": "%s", "expires_at": "2030-01-01T00:00:00Z"}' % token
+        ).encode("utf-8")
+
+    def raise_for_status(self):
+        pass
+
+
+class _FakeJWT:
+    def __init__(self):
+        self.signed = 0
+
+    def encode(self, payload, key, algorithm):
+        self.signed += 1
+        return f"jwt-{self.signed}"
+
+
+def test_second_mint_reuses_app_jwt(monkeypatch):
+    fake_jwt = _FakeJWT()
+    sent_auth = []
+
+    def fake_post(url, headers, timeout):
+        sent_auth.append(headers["Authorization"])
+        return _FakeResponse(f"token-{len(sent_auth)}")
+
+    monkeypatch.setattr(github_service, "jwt", fake_jwt)
+    monkeypatch.setattr(github_service, "_load_signing_key", lambda path: "key")
+    monkeypatch.setattr(github_service._github_session, "post", fake_post)
+    monkeypatch.setattr(github_service, "_APP_JWT", {})
+
+    first = github_service._mint_installation_token("123", "app.pem", 1)
+    second = github_service._mint_installation_token("123", "app.pem", 2)
+
+    assert fake_jwt.signed == 1
+    assert sent_auth == ["Bearer jwt-1", "Bearer jwt-1"]
+    assert (first[0], second[0]) == ("token-1", "token-2")
+    assert first[1] == second[1] > 0
@@ -0,0 +1,70 @@
+"""Cached findings reused when the same change lands at other lines."""
+
+from app.models import FindingCategory, FindingSeverity
+from app.services import llm_service
+from app.services.llm_service import LLMService
+
+
+class _FakeCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def set(self, key, value):
+        self.entries[key] = value
+
+
+def _service():
+    service = LLMService.__new__(LLMService)
+    service._response_cache = _FakeCache()
+    service._raw_cache_model = "raw:groq/test-model"
+    return service
+
+
+def _file(start: int, lines_above: int) -> dict:
+    content = "\n".join(
+        [f"header {i}" for i in range(lines_above)]
+        + [f"line {i}" for i in range(60)]
+    )
+    patch = f"@@ -{start},2 +{start},3 @@\n line a\n+added = eval(x)\n line b"
+    return {"filename": "app/util.py", "full_content": content, "patch": patch}
+
+
+def _finding(line_number: int) -> dict:
+    return {
+        "file_path": "app/util.py",
+        "line_number": line_number,
+        "severity": FindingSeverity.HIGH,
+        "category": FindingCategory.SECURITY,
+        "title": "eval on input",
+        "description": "eval runs arbitrary code",
+        "suggestion": "",
+    }
+
+
+def test_moved_findings_shift_with_their_hunk(monkeypatch):
+    monkeypatch.setattr(llm_service.settings, "llm_reuse_moved_findings", True)
+    monkeypatch.setattr(llm_service.settings, "llm_triage", False)
+    service = _service()
+
+    key, cached = service._findings_cache_lookup(_file(40, 0), 0, "octo/repo")
+    assert cached is None
+    service._findings_cache_store(key, [_finding(41)])
+
+    # Same change after 25 lines were added above it
+    _, cached = service._findings_cache_lookup(_file(65, 25), 0, "octo/repo")
+    assert [f["line_number"] for f in cached] == [66]
+
+
+def test_moved_findings_stay_in_their_repository(monkeypatch):
+    monkeypatch.setattr(llm_service.settings, "llm_reuse_moved_findings", True)
+    monkeypatch.setattr(llm_service.settings, "llm_triage", False)
+    service = _service()
+
+    key, _ = service._findings_cache_lookup(_file(40, 0), 0, "octo/repo")
+    service._findings_cache_store(key, [_finding(41)])
+
+    _, cached = service._findings_cache_lookup(_file(65, 25), 0, "other/repo")
+    assert cached is None